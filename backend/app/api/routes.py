@@ -1,14 +1,19 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response
 from typing import List, Dict, Any, Optional
 from app.models.zidoo_models import ToggleServiceRequest, ToggleServiceResponse
-from app.core.config import settings
+from app.core.config import settings, config_store
+from app.core.config_writer import config_writer
+from app.core.config_reloader import config_reloader
 from app.core.logger import logger
-from app.services.watcher_service import WatcherService
-from app.services.path_mapper import PathMapper
+from app.services.watcher_manager import WatcherManager
+from app.services.path_mapper import PathMapper, MappingImportError
 from app.core.log_buffer import log_buffer
+import json
 import time
 import os
 import platform
+import yaml
 
 # 设置时区 - 针对不同操作系统
 if platform.system() == "Windows":
@@ -32,107 +37,122 @@ else:
         pass
 
 # Global instances (will be set by main.py)
-watcher_service: WatcherService = None
+watcher_manager: WatcherManager = None
 
 api_router = APIRouter()
 
+def _get_watcher(device: Optional[str] = None):
+    """Watcher of the requested device (the first device by default)"""
+    if not watcher_manager:
+        raise HTTPException(status_code=500, detail="监控服务未初始化")
+    watcher = watcher_manager.get(device)
+    if watcher is None:
+        raise HTTPException(status_code=404, detail=f"未知设备: {device}")
+    return watcher
+
 # Service control endpoints
 @api_router.post("/service/start", response_model=Dict[str, Any])
-async def start_service():
+async def start_service(device: Optional[str] = Query(None, description="Device name, all devices if omitted")):
     """Start the watcher service"""
-    if not watcher_service:
-        raise HTTPException(status_code=500, detail="监控服务未初始化")
-    
-    await watcher_service.start()
+    _get_watcher(device)
+    await watcher_manager.start(device)
     return {"success": True, "message": "服务已启动"}
 
 @api_router.post("/service/stop", response_model=Dict[str, Any])
-async def stop_service():
+async def stop_service(device: Optional[str] = Query(None, description="Device name, all devices if omitted")):
     """Stop the watcher service"""
-    if not watcher_service:
-        raise HTTPException(status_code=500, detail="监控服务未初始化")
-    
-    await watcher_service.stop()
+    _get_watcher(device)
+    await watcher_manager.stop(device)
     return {"success": True, "message": "服务已停止"}
 
 
 
 @api_router.get("/service/status", response_model=Dict[str, Any])
-async def get_service_status():
-    """Get the current service status"""
-    if not watcher_service:
-        raise HTTPException(status_code=500, detail="监控服务未初始化")
-    
-    return watcher_service.get_status()
+async def get_service_status(device: Optional[str] = Query(None, description="Device name, the first device if omitted")):
+    """Get the current service status of a device, with an overview of all devices"""
+    watcher = _get_watcher(device)
+    return watcher_manager.get_status(watcher.device_name)
 
 @api_router.get("/service/connectivity", response_model=Dict[str, Any])
-async def get_connectivity_status():
+async def get_connectivity_status(device: Optional[str] = Query(None, description="Device name, the first device if omitted")):
     """Get the current device connectivity status"""
-    if not watcher_service:
-        raise HTTPException(status_code=500, detail="监控服务未初始化")
-    
-    return watcher_service.zidoo_client.get_connectivity_status()
+    return _get_watcher(device).zidoo_client.get_connectivity_status()
 
 # Configuration endpoints
 @api_router.get("/config", response_model=Dict[str, Any])
 async def get_config():
     """Get current configuration"""
     # 构建配置响应，不包含端口（因为端口固定为9529）
+    # 所有字段取自同一份配置快照
+    config = config_store.snapshot()
     config_response = {
-        "general": settings.general.model_dump(),
+        "general": config.general.model_dump(),
         "zidoo": {
-            "ip": settings.zidoo.ip,
-            "api_path": settings.zidoo.api_path
+            "ip": config.zidoo.ip,
+            "api_path": config.zidoo.api_path,
+            "mac": config.zidoo.mac
         },
-        "notification": settings.notification.model_dump(),
-        "extension_monitoring": settings.extension_monitoring.model_dump(),
-        "clouddrive": settings.clouddrive.model_dump()
+        "notification": config.notification.model_dump(),
+        "extension_monitoring": config.extension_monitoring.model_dump(),
+        "clouddrive": config.clouddrive.model_dump(),
+        "strm": config.strm.model_dump(),
+        "devices": [device.model_dump() for device in config.devices],
+        "discovery": config.discovery.model_dump()
     }
     return config_response
 
+@api_router.get("/config/status", response_model=Dict[str, Any])
+async def get_config_status():
+    """Get config snapshot version, write-behind persistence and hot-reload statistics"""
+    return {
+        "store": config_store.get_stats(),
+        "writer": config_writer.get_stats(),
+        "reloader": config_reloader.get_stats()
+    }
+
 @api_router.post("/config", response_model=Dict[str, Any])
 async def update_config(config_data: Dict[str, Any]):
     """Update configuration"""
     try:
-        # Update general settings
-        if "general" in config_data:
-            for key, value in config_data["general"].items():
-                if hasattr(settings.general, key):
-                    setattr(settings.general, key, value)
-        
-        # Update zidoo settings
-        if "zidoo" in config_data:
-            for key, value in config_data["zidoo"].items():
-                # 跳过端口设置，因为端口固定为9529
-                if key == "port":
-                    continue
-                if hasattr(settings.zidoo, key):
-                    setattr(settings.zidoo, key, value)
+        # 所有修改应用到配置副本，校验通过后整体替换，心跳循环不会读到只改了一半的配置
+        def apply(data: Dict[str, Any]):
+            for section in ("general", "zidoo", "notification", "extension_monitoring",
+                            "clouddrive", "strm", "discovery"):
+                for key, value in config_data.get(section, {}).items():
+                    # 跳过端口设置，因为端口固定为9529
+                    if section == "zidoo" and key == "port":
+                        continue
+                    if key in data[section]:
+                        data[section][key] = value
+            
+            # Device list is validated (fields, unique names) with the new snapshot
+            if "devices" in config_data:
+                data["devices"] = config_data["devices"]
         
-        # Update notification settings
-        if "notification" in config_data:
-            for key, value in config_data["notification"].items():
-                if hasattr(settings.notification, key):
-                    setattr(settings.notification, key, value)
+        devices = config_data.get("devices")
+        if isinstance(devices, list):
+            names = [device.get("name") for device in devices if isinstance(device, dict)]
+            if len(names) != len(set(names)):
+                raise HTTPException(status_code=400, detail="设备名称不能重复")
         
-        # Update extension monitoring settings
-        if "extension_monitoring" in config_data:
-            for key, value in config_data["extension_monitoring"].items():
-                if hasattr(settings.extension_monitoring, key):
-                    setattr(settings.extension_monitoring, key, value)
+        old = config_store.snapshot()
+        try:
+            new = config_store.update(apply)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid configuration: {e}")
         
-        # Update clouddrive settings
-        if "clouddrive" in config_data:
-            for key, value in config_data["clouddrive"].items():
-                if hasattr(settings.clouddrive, key):
-                    setattr(settings.clouddrive, key, value)
+        # Same as a reloaded config file: create watchers for added devices, update shared services
+        if watcher_manager:
+            await watcher_manager.apply_config(old, new)
         
         # Save configuration
-        settings.save_to_file()
+        config_writer.mark_dirty()
         
         logger.info("Configuration updated")
         return {"success": True, "message": "Configuration updated"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating configuration: {e}")
         raise HTTPException(status_code=500, detail=f"Error updating configuration: {e}")
@@ -147,12 +167,14 @@ async def get_extension_monitoring():
 async def update_extension_monitoring(extension_data: Dict[str, bool]):
     """Update extension monitoring configuration"""
     try:
-        for key, value in extension_data.items():
-            if hasattr(settings.extension_monitoring, key):
-                setattr(settings.extension_monitoring, key, value)
+        def apply(data: Dict[str, Any]):
+            for key, value in extension_data.items():
+                if key in data["extension_monitoring"]:
+                    data["extension_monitoring"][key] = value
+        config_store.update(apply)
         
         # Save configuration
-        settings.save_to_file()
+        config_writer.mark_dirty()
         
         logger.info("Extension monitoring configuration updated")
         return {"success": True, "message": "扩展名监控配置已更新"}
@@ -168,6 +190,14 @@ async def get_path_mappings():
     path_mapper = PathMapper()
     return path_mapper.get_all_mappings()
 
+@api_router.get("/mappings/stats", response_model=Dict[str, Any])
+async def get_path_mapping_stats():
+    """Get path mapping index and result cache statistics"""
+    return {
+        "index": PathMapper.get_index_stats(),
+        "cache": PathMapper.get_cache_stats()
+    }
+
 @api_router.post("/mappings", response_model=Dict[str, Any])
 async def add_path_mapping(mapping: Dict[str, Any]):
     """Add a new path mapping"""
@@ -176,6 +206,7 @@ async def add_path_mapping(mapping: Dict[str, Any]):
         mapping_type = mapping.get("mapping_type", "media")
         target = mapping.get("target")
         enable = mapping.get("enable", True)
+        endpoint = mapping.get("endpoint") or None
         
         if not target:
             raise HTTPException(status_code=400, detail="Target path is required")
@@ -183,8 +214,9 @@ async def add_path_mapping(mapping: Dict[str, Any]):
         if mapping_type not in ["media", "strm"]:
             raise HTTPException(status_code=400, detail=f"Invalid mapping_type: {mapping_type}. Must be 'media' or 'strm'")
         
-        path_mapper.add_mapping(mapping["source"], mapping_type=mapping_type, target=target, enable=enable)
-        settings.save_to_file()
+        path_mapper.add_mapping(mapping["source"], mapping_type=mapping_type, target=target, enable=enable,
+                                endpoint=endpoint)
+        config_writer.mark_dirty()
         
         logger.info(f"路径映射已添加: {mapping['source']} (类型: {mapping_type})")
         return {"success": True, "message": "路径映射已添加"}
@@ -205,6 +237,7 @@ async def update_path_mapping(mapping: Dict[str, Any]):
         old_target = mapping.get("old_target")
         new_source = mapping.get("new_source")
         new_target = mapping.get("new_target")
+        new_endpoint = mapping.get("new_endpoint")
         
         if not old_source:
             raise HTTPException(status_code=400, detail="old_source is required")
@@ -214,9 +247,10 @@ async def update_path_mapping(mapping: Dict[str, Any]):
             old_mapping_type=old_mapping_type,
             old_target=old_target,
             new_source=new_source,
-            new_target=new_target
+            new_target=new_target,
+            new_endpoint=new_endpoint
         )
-        settings.save_to_file()
+        config_writer.mark_dirty()
         
         logger.info(f"路径映射已更新: {old_source}")
         return {"success": True, "message": "路径映射已更新"}
@@ -237,7 +271,7 @@ async def remove_path_mapping(mapping: Dict[str, Any]):
         target = mapping.get("target")
         
         path_mapper.remove_mapping(source, mapping_type=mapping_type, target=target)
-        settings.save_to_file()
+        config_writer.mark_dirty()
         
         logger.info(f"路径映射已删除: {source}")
         return {"success": True, "message": "路径映射已删除"}
@@ -257,7 +291,7 @@ async def toggle_path_mapping(mapping: Dict[str, Any]):
         enable = mapping.get("enable", True)
         
         path_mapper.toggle_mapping(source, mapping_type=mapping_type, target=target, enable=enable)
-        settings.save_to_file()
+        config_writer.mark_dirty()
         
         status = "启用" if enable else "禁用"
         logger.info(f"路径映射状态已切换: {source} ({status})")
@@ -267,11 +301,119 @@ async def toggle_path_mapping(mapping: Dict[str, Any]):
         logger.error(f"切换路径映射状态时出错: {e}")
         raise HTTPException(status_code=500, detail=f"切换路径映射状态时出错: {e}")
 
+@api_router.get("/mappings/export")
+async def export_path_mappings(format: str = Query("json", description="json or yaml")):
+    """Export all path mappings as {"mapping_paths": [...]} (same layout as config.yaml)"""
+    data = {"mapping_paths": PathMapper().get_all_mappings()}
+    if format == "yaml":
+        content = yaml.dump(data, default_flow_style=False, allow_unicode=True, sort_keys=False)
+        return Response(content=content, media_type="application/x-yaml",
+                        headers={"Content-Disposition": "attachment; filename=mappings.yaml"})
+    if format != "json":
+        raise HTTPException(status_code=400, detail=f"Invalid format: {format}. Must be 'json' or 'yaml'")
+    return data
+
+@api_router.post("/mappings/import", response_model=Dict[str, Any])
+async def import_path_mappings(request: Request,
+                               mode: str = Query("replace", description="replace or merge"),
+                               format: Optional[str] = Query(None, description="json or yaml, by Content-Type if omitted"),
+                               dry_run: bool = Query(False, description="Validate only")):
+    """Import a whole mapping set in one step: validated up front, applied and saved once
+    
+    The body is a list of mappings or {"mapping_paths": [...]}, as JSON or YAML.
+    """
+    body = await request.body()
+    if format is None:
+        format = "yaml" if "yaml" in request.headers.get("content-type", "") else "json"
+    try:
+        data = yaml.safe_load(body) if format == "yaml" else json.loads(body)
+    except (ValueError, yaml.YAMLError) as e:
+        raise HTTPException(status_code=400, detail=f"无法解析导入内容: {e}")
+    if isinstance(data, dict):
+        data = data.get("mapping_paths")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="导入内容必须是映射列表或包含 mapping_paths 的对象")
+    
+    try:
+        result = PathMapper().import_mappings(data, mode=mode, dry_run=dry_run)
+    except MappingImportError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not dry_run:
+        config_writer.mark_dirty()
+    return {"success": True, "dry_run": dry_run, **result}
+
+# STRM endpoints
+@api_router.get("/strm/stats", response_model=Dict[str, Any])
+async def get_strm_stats():
+    """Get STRM resolution cache statistics"""
+    if not watcher_manager:
+        raise HTTPException(status_code=500, detail="监控服务未初始化")
+    
+    return {
+        "cache": watcher_manager.resources.strm_processor.get_cache_stats(),
+        "index": watcher_manager.resources.strm_processor.indexer.get_stats()
+    }
+
+@api_router.post("/strm/index/refresh", response_model=Dict[str, Any])
+async def refresh_strm_index():
+    """Rescan the STRM library index now"""
+    if not watcher_manager:
+        raise HTTPException(status_code=500, detail="监控服务未初始化")
+    
+    try:
+        stats = await watcher_manager.resources.strm_processor.indexer.refresh()
+        return {"success": True, "message": "STRM索引已更新", "index": stats}
+    except Exception as e:
+        logger.error(f"刷新STRM索引时出错: {e}")
+        raise HTTPException(status_code=500, detail=f"刷新STRM索引时出错: {e}")
+
+@api_router.get("/notification/outbox", response_model=Dict[str, Any])
+async def get_notification_outbox():
+    """List notifications waiting to be retried"""
+    if not watcher_manager:
+        raise HTTPException(status_code=500, detail="监控服务未初始化")
+
+    outbox = watcher_manager.resources.notification_service.outbox
+    return {
+        "pending": outbox.get_pending(),
+        "stats": outbox.get_stats()
+    }
+
+# Device discovery endpoints
+@api_router.get("/discovery", response_model=Dict[str, Any])
+async def get_discovery_results():
+    """Get the cached LAN scan results"""
+    if not watcher_manager:
+        raise HTTPException(status_code=500, detail="监控服务未初始化")
+    
+    return watcher_manager.discovery.get_status()
+
+@api_router.post("/discovery/scan", response_model=Dict[str, Any])
+async def scan_devices(
+    cidr: Optional[str] = Query(None, description="Network to scan, e.g. 192.168.1.0/24"),
+    force: bool = Query(True, description="Ignore cached results")
+):
+    """Scan the LAN for Zidoo devices on port 9529"""
+    if not watcher_manager:
+        raise HTTPException(status_code=500, detail="监控服务未初始化")
+    
+    try:
+        devices = await watcher_manager.discovery.scan(cidr, force=force)
+        return {"success": True, "devices": devices, "scan": watcher_manager.discovery.get_status()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"扫描Zidoo设备时出错: {e}")
+        raise HTTPException(status_code=500, detail=f"扫描Zidoo设备时出错: {e}")
+
 # Callback endpoint for external services
 @api_router.post("/toggle_service", response_model=ToggleServiceResponse)
 async def toggle_service(request: ToggleServiceRequest):
     """Toggle service based on external request"""
-    if not watcher_service:
+    if not watcher_manager:
         raise HTTPException(status_code=500, detail="监控服务未初始化")
     
     if request.serviceName != "filewatcher":
@@ -283,11 +425,11 @@ async def toggle_service(request: ToggleServiceRequest):
     
     try:
         if request.action == "start":
-            await watcher_service.start()
+            await watcher_manager.start()
             service_status = "running"
             message = "服务已启动"
         elif request.action == "stop":
-            await watcher_service.stop()
+            await watcher_manager.stop()
             service_status = "stopped"
             message = "服务已停止"
         else:
@@ -326,36 +468,33 @@ async def health_check():
 @api_router.get("/logs/recent", response_model=Dict[str, Any])
 async def get_recent_logs(
     since_id: Optional[int] = Query(0, description="Get logs since this ID"), 
-    limit: Optional[int] = Query(50, description="Maximum number of logs to return")
+    limit: Optional[int] = Query(50, description="Maximum number of logs to return"),
+    epoch: Optional[str] = Query(None, description="Log epoch the client's since_id belongs to")
 ):
-    """Get recent logs for polling"""
+    """Get recent logs for polling
+    
+    `reset` is True when the client's epoch or since_id no longer matches
+    the buffer (logs cleared or service restarted); the client should then
+    drop its logs and continue from `latest_id` in the returned `epoch`.
+    """
     try:
-        if since_id:
-            logs = log_buffer.get_logs_since(since_id)
-        else:
-            logs = log_buffer.get_latest_logs(limit)
-        
-        return {
-            "success": True,
-            "logs": logs,
-            "latest_id": logs[-1]["id"] if logs else 0
-        }
+        result = log_buffer.poll(since_id or 0, epoch, limit)
+        return {"success": True, **result}
     except Exception as e:
         logger.error(f"Error getting recent logs: {e}")
         raise HTTPException(status_code=500, detail=f"Error getting logs: {e}")
 
 @api_router.get("/status/current", response_model=Dict[str, Any])
-async def get_current_status():
+async def get_current_status(device: Optional[str] = Query(None, description="Device name, the first device if omitted")):
     """Get current player and service status for polling"""
-    if not watcher_service:
-        raise HTTPException(status_code=500, detail="监控服务未初始化")
+    watcher = _get_watcher(device)
     
     try:
         # Get service status
-        service_status = watcher_service.get_status()
+        service_status = watcher_manager.get_status(watcher.device_name)
         
         # Get current player status (direct call, not cached)
-        player_status = getattr(watcher_service, 'last_status', None)
+        player_status = getattr(watcher, 'last_status', None)
         
         return {
             "success": True,
@@ -373,7 +512,7 @@ async def clear_logs():
     try:
         log_buffer.clear()
         logger.info("Logs cleared")
-        return {"success": True, "message": "Logs cleared"}
+        return {"success": True, "message": "Logs cleared", "epoch": log_buffer.epoch}
     except Exception as e:
         logger.error(f"Error clearing logs: {e}")
         raise HTTPException(status_code=500, detail=f"Error clearing logs: {e}") 
\ No newline at end of file
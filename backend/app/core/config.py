@@ -1,36 +1,110 @@
 import yaml
 import os
-from typing import List, Optional, Literal
-from pydantic import BaseModel, model_validator
+import threading
+from typing import Any, Callable, Dict, List, Optional, Literal, Union
+from pydantic import BaseModel, ConfigDict, PrivateAttr, field_validator, model_validator
 from pathlib import Path
 
+# 各轮询状态的心跳间隔安全范围 (ms)
+HEART_RATE_BOUNDS = {
+    "heart_rate": (200, 2000),                # 空闲/等待播放
+    "playing_heart_rate": (500, 10000),       # 正在播放未处理的视频
+    "offline_heart_rate_max": (2000, 120000)  # 设备离线时退避上限
+}
+
+def clamp_heart_rate(field: str, value: int) -> int:
+    """Clamp a heart rate value into its per-state bounds"""
+    low, high = HEART_RATE_BOUNDS[field]
+    return min(max(value, low), high)
+
+def get_config_dir() -> str:
+    """配置目录：Docker 环境为 /config，开发环境为项目根目录下的 config"""
+    if os.path.exists("/config"):
+        return "/config"
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    # 从 backend/app/core/ 向上找到项目根目录
+    while current_dir != os.path.dirname(current_dir):
+        if os.path.exists(os.path.join(current_dir, 'requirements.txt')):
+            break
+        current_dir = os.path.dirname(current_dir)
+    return os.path.join(current_dir, "config")
+
+def get_config_path() -> str:
+    """config.yaml 路径（与 save_to_file 的默认路径一致）"""
+    return os.path.join(get_config_dir(), "config.yaml")
+
 class GeneralConfig(BaseModel):
-    heart_rate: int = 500
+    model_config = ConfigDict(frozen=True)
+    
+    heart_rate: int = 500  # 空闲时的轮询间隔，快速发现新的播放
+    playing_heart_rate: int = 2000  # 播放中（未映射或继续本机播放）的轮询间隔
+    offline_heart_rate_max: int = 30000  # 离线指数退避的最大间隔
     log_level: str = "INFO"
     auto_start: bool = False
+    event_concurrency: int = 2  # 播放事件处理的最大并发数
+    zidoo_timeout_factor: float = 4.0  # Zidoo请求超时 = 往返时间 p99 × 该系数
+    zidoo_timeout_min_seconds: float = 0.5  # 自适应超时下限
+    zidoo_timeout_max_seconds: float = 10.0  # 自适应超时上限，样本不足时使用
+    zidoo_timeout_min_samples: int = 20  # 开始自适应所需的最少样本数
+    handoff_deadline_seconds: float = 20.0  # 播放交接(STRM解析、映射、通知、停止)的总时限，0 表示不限制
+    config_watch: bool = True  # 监视 config.yaml，外部修改后自动重新加载（重启后生效）
     
-    def __init__(self, **data):
-        super().__init__(**data)
-        # 确保心跳频率在安全范围内
-        if self.heart_rate < 200:
-            self.heart_rate = 200  # 最小200ms
-        elif self.heart_rate > 2000:
-            self.heart_rate = 2000  # 最大2秒
+    @model_validator(mode='before')
+    @classmethod
+    def clamp_heart_rates(cls, data):
+        """确保心跳频率在安全范围内"""
+        if isinstance(data, dict):
+            data = dict(data)
+            for field in HEART_RATE_BOUNDS:
+                if field in data:
+                    data[field] = clamp_heart_rate(field, int(data[field]))
+        return data
+
+# Zidoo 控制接口端口固定为9529
+ZIDOO_PORT = 9529
 
 class ZidooConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     ip: str = "192.168.1.99"
     api_path: str = "/ZidooVideoPlay/getPlayStatus"
+    mac: Optional[str] = None  # 设备MAC地址，用于在IP变化后重新找到设备
     
     @property
     def port(self) -> int:
         """端口固定为9529"""
-        return 9529
+        return ZIDOO_PORT
+
+# 未配置 devices 时，唯一的设备使用 zidoo 配置，名称为 default
+DEFAULT_DEVICE = "default"
+
+class DeviceConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    name: str  # 设备名称，用于日志和 /service/status?device=...
+    ip: str
+    api_path: str = "/ZidooVideoPlay/getPlayStatus"
+    enable: bool = True
+    mac: Optional[str] = None  # 设备MAC地址，用于在IP变化后重新找到设备
+    
+    @property
+    def port(self) -> int:
+        """端口固定为9529"""
+        return ZIDOO_PORT
 
 class PathMapping(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     source: str
     mapping_type: Literal["media", "strm"] = "media"  # Type of mapping: "media" for real media files, "strm" for STRM files
     target: str  # Target path - for media mappings: BlurayPoster path; for STRM mappings: actual file system path to read .strm files
     enable: bool = True  # 默认启用
+    endpoint: Optional[str] = None  # 仅媒体映射：该媒体库专用的通知地址，为空则使用 notification.endpoint
+    
+    @field_validator('endpoint', mode='before')
+    @classmethod
+    def empty_endpoint_to_none(cls, value):
+        return value or None
     
     @model_validator(mode='after')
     def validate_mapping_fields(self):
@@ -40,10 +114,27 @@ class PathMapping(BaseModel):
         return self
 
 class NotificationConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     endpoint: str = "http://192.168.1.50:7507/play"
     timeout_seconds: int = 10
+    keepalive_interval_seconds: int = 30  # 通知连接保活探测间隔，0 表示关闭；启用健康检查时由健康检查代替探测
+    speculative_pause: bool = False  # 发送通知的同时先暂停本机播放，远程接受后停止，否则恢复播放
+    extra_endpoints: List[str] = []  # 额外的通知地址，与 endpoint 并发发送
+    fanout_policy: Literal["primary", "first_success", "all_success"] = "primary"  # 多地址时停止本机播放的判定策略
+    health_check_interval_seconds: int = 15  # 通知地址健康检查间隔，0 表示关闭
+    health_check_path: str = ""  # 健康检查路径（相对通知地址），为空则探测通知地址本身
+    health_check_method: Literal["HEAD", "GET"] = "HEAD"
+    skip_when_down: bool = False  # 健康检查显示远程设备离线时跳过通知，直接继续本机播放
+    outbox_enabled: bool = False  # 本机已停止播放但发送失败（网络错误/超时）的通知写入重试队列，持久化并按指数退避重试
+    outbox_retry_base_seconds: int = 5  # 首次重试间隔，之后每次翻倍
+    outbox_retry_max_seconds: int = 300  # 重试间隔上限
+    outbox_dedup_window_seconds: int = 60  # 同一路径、同一地址在此时间内只保留一条
+    outbox_max_age_seconds: int = 600  # 超过此时间仍未送达的条目视为过期并丢弃
 
 class ExtensionMonitoringConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     bdmv: bool = True
     iso: bool = True
     mkv: bool = False
@@ -51,15 +142,114 @@ class ExtensionMonitoringConfig(BaseModel):
     m2ts: bool = False
 
 class CloudDriveConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
     mount_path: str = ""
 
+class StrmConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    read_timeout_seconds: float = 5.0  # 读取STRM文件的超时时间，防止网络共享挂起时阻塞服务
+    io_workers: int = 4  # 读取STRM文件的线程池大小
+    cache_size: int = 512  # STRM解析结果缓存条目数
+    negative_ttl_seconds: float = 10.0  # 读取失败结果的缓存时间
+    index_enabled: bool = False  # 后台扫描STRM目录并建立索引，播放时只需校验文件 mtime/size，无需读取网络共享
+    index_refresh_minutes: int = 30  # 增量重新扫描的间隔
+    index_scan_workers: int = 8  # 并发扫描目录的线程数
+
+class DiscoveryConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    cidr: str = ""  # 扫描网段，为空时使用第一台设备所在的 /24
+    concurrency: int = 64  # 并发探测的主机数
+    connect_timeout_seconds: float = 0.5
+    request_timeout_seconds: float = 1.5
+    cache_ttl_seconds: int = 300  # 扫描结果缓存时间
+    scan_on_startup: bool = False  # 启动时扫描并修正设备地址
+    follow_ip_changes: bool = False  # 设备离线时按MAC地址重新扫描，自动跟随IP变化
+    follow_interval_seconds: int = 60  # 跟随检查的间隔
+
+def migrate_mapping_data(mappings: List[dict]) -> List[dict]:
+    """Migrate raw mapping dicts to the current format and sort them (media first, then strm)
+
+    Older configs had no mapping_type and kept STRM paths in a separate
+    `strm` field; those are consolidated into target.
+    """
+    for mapping in mappings:
+        # If mapping_type is not set, determine it from existing fields
+        if 'mapping_type' not in mapping:
+            has_target = mapping.get('target') is not None and mapping.get('target') != ''
+            has_strm = mapping.get('strm') is not None and mapping.get('strm') != ''
+            
+            if has_strm:
+                # If strm is set, use it as target and set type to strm
+                mapping['mapping_type'] = 'strm'
+                mapping['target'] = mapping.get('strm')
+            elif has_target:
+                # Only target: media mapping
+                mapping['mapping_type'] = 'media'
+            else:
+                # Neither set: default to media (will fail validation, but better than nothing)
+                mapping['mapping_type'] = 'media'
+        
+        # Remove strm field if it exists (we now use target for both)
+        if 'strm' in mapping:
+            del mapping['strm']
+    
+    def sort_key(mapping):
+        # media = 0, strm = 1 (so media comes first)
+        mapping_type = mapping.get('mapping_type', 'media')
+        return 0 if mapping_type == 'media' else 1
+    
+    return sorted(mappings, key=sort_key)
+
 class Settings(BaseModel):
+    """
+    One immutable configuration snapshot
+
+    Snapshots are published through `config_store`; never mutate one in
+    place (lists such as mapping_paths are shared between snapshots).
+    """
+    model_config = ConfigDict(frozen=True)
+    
     general: GeneralConfig = GeneralConfig()
     zidoo: ZidooConfig = ZidooConfig()
     mapping_paths: List[PathMapping] = []
     notification: NotificationConfig = NotificationConfig()
     extension_monitoring: ExtensionMonitoringConfig = ExtensionMonitoringConfig()
     clouddrive: CloudDriveConfig = CloudDriveConfig()
+    strm: StrmConfig = StrmConfig()
+    devices: List[DeviceConfig] = []  # 多台Zidoo设备；为空时使用 zidoo 配置的单台设备
+    discovery: DiscoveryConfig = DiscoveryConfig()
+    _version: int = PrivateAttr(default=0)
+
+    @property
+    def version(self) -> int:
+        """Version assigned when this snapshot was published"""
+        return self._version
+
+    @model_validator(mode='after')
+    def validate_devices(self):
+        """Device names must be unique"""
+        names = [device.name for device in self.devices]
+        if len(names) != len(set(names)):
+            raise ValueError('Device names must be unique')
+        return self
+
+    def get_device_names(self) -> List[str]:
+        """Names of the devices to watch"""
+        if not self.devices:
+            return [DEFAULT_DEVICE]
+        return [device.name for device in self.devices if device.enable]
+
+    def get_device(self, name: str) -> Optional[Union[ZidooConfig, DeviceConfig]]:
+        """Connection settings of a device (the zidoo section for the default device)"""
+        if not self.devices:
+            return self.zidoo if name == DEFAULT_DEVICE else None
+        for device in self.devices:
+            if device.name == name:
+                return device
+        return None
 
     @classmethod
     def load_from_file(cls, config_path: str = None) -> "Settings":
@@ -92,45 +282,27 @@ class Settings(BaseModel):
         
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
-                config_data = yaml.safe_load(f)
-            
-            # Migrate existing path mappings to include mapping_type and consolidate strm into target
-            if config_data and 'mapping_paths' in config_data:
-                for mapping in config_data['mapping_paths']:
-                    # If mapping_type is not set, determine it from existing fields
-                    if 'mapping_type' not in mapping:
-                        has_target = mapping.get('target') is not None and mapping.get('target') != ''
-                        has_strm = mapping.get('strm') is not None and mapping.get('strm') != ''
-                        
-                        if has_strm:
-                            # If strm is set, use it as target and set type to strm
-                            mapping['mapping_type'] = 'strm'
-                            mapping['target'] = mapping.get('strm')
-                        elif has_target:
-                            # Only target: media mapping
-                            mapping['mapping_type'] = 'media'
-                        else:
-                            # Neither set: default to media (will fail validation, but better than nothing)
-                            mapping['mapping_type'] = 'media'
-                    
-                    # Remove strm field if it exists (we now use target for both)
-                    if 'strm' in mapping:
-                        del mapping['strm']
-            
-            # Sort mappings: media type first, then strm type
-            if config_data and 'mapping_paths' in config_data and config_data['mapping_paths']:
-                def sort_key(mapping):
-                    # media = 0, strm = 1 (so media comes first)
-                    mapping_type = mapping.get('mapping_type', 'media')
-                    return 0 if mapping_type == 'media' else 1
-                
-                config_data['mapping_paths'] = sorted(config_data['mapping_paths'], key=sort_key)
-            
-            return cls(**config_data)
+                return cls.from_yaml(f.read())
         except Exception as e:
             print(f"Error loading config from {config_path}: {e}")
             return cls()
 
+    @classmethod
+    def from_yaml(cls, text: str) -> "Settings":
+        """Parse config.yaml content, migrating old mapping fields and sorting mappings
+
+        Raises:
+            ValueError: if the content is not a mapping or fails validation
+        """
+        config_data = yaml.safe_load(text)
+        if not isinstance(config_data, dict):
+            raise ValueError("配置文件为空或格式不正确")
+        
+        if config_data.get('mapping_paths'):
+            config_data['mapping_paths'] = migrate_mapping_data(config_data['mapping_paths'])
+        
+        return cls(**config_data)
+
     def save_to_file(self, config_path: str = None):
         if config_path is None:
             # 统一保存路径
@@ -149,11 +321,131 @@ class Settings(BaseModel):
                 project_root = get_project_root()
                 config_path = os.path.join(project_root, "config", "config.yaml")
         try:
-            os.makedirs(os.path.dirname(config_path), exist_ok=True)
-            with open(config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(self.model_dump(), f, default_flow_style=False, allow_unicode=True)
+            write_config_atomic(config_path, self.dump_yaml())
         except Exception as e:
             print(f"Error saving config to {config_path}: {e}")
 
+    def dump_yaml(self) -> str:
+        """Serialize this snapshot as config.yaml content"""
+        return yaml.dump(self.model_dump(), default_flow_style=False, allow_unicode=True)
+
+def write_config_atomic(config_path: str, content: str):
+    """Replace config_path with content without ever leaving a partially written file
+
+    Writes a temp file in the same directory, fsyncs it and renames it over
+    the old file, so a crash leaves either the old or the new config.
+    """
+    directory = os.path.dirname(config_path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{config_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, config_path)
+    if hasattr(os, "O_DIRECTORY"):
+        # 同步目录项，确保重命名本身落盘（Windows 不支持）
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class ConfigStore:
+    """
+    Holder of the current immutable Settings snapshot
+
+    Writers never modify a snapshot: `update()` applies changes to a plain
+    dict copy, validates the result as a new Settings and publishes it with a
+    single reference swap, so readers that take `snapshot()` once per poll
+    never observe a half-applied update. Every publish increments the
+    version, which derived caches compare instead of re-reading settings.
+    Sections an update leaves equal keep their previous objects, so an
+    identity check (e.g. on mapping_paths) tells whether a section changed.
+    """
+
+    def __init__(self, initial: Settings):
+        self._lock = threading.Lock()
+        self._snapshot = initial
+        self.publishes = 0
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def snapshot(self) -> Settings:
+        """The current snapshot; keep using the same one for a whole poll/request"""
+        return self._snapshot
+
+    def update(self, mutate: Callable[[Dict[str, Any]], None]) -> Settings:
+        """Apply `mutate` to a dict copy of the current config and publish the result
+
+        Raises:
+            ValueError: (pydantic ValidationError) if the result is invalid; nothing is published
+        """
+        with self._lock:
+            data = self._snapshot.model_dump()
+            mutate(data)
+            return self._publish(Settings.model_validate(data))
+
+    def replace(self, new: Settings) -> Settings:
+        """Publish an already validated Settings (e.g. freshly loaded from file)"""
+        with self._lock:
+            return self._publish(new)
+
+    def update_device(self, name: str, **fields) -> Settings:
+        """Change connection fields (ip, mac, ...) of one device"""
+        def mutate(data: Dict[str, Any]):
+            if not data["devices"]:
+                if name == DEFAULT_DEVICE:
+                    data["zidoo"].update(fields)
+                return
+            for device in data["devices"]:
+                if device["name"] == name:
+                    device.update(fields)
+        return self.update(mutate)
+
+    def _publish(self, new: Settings) -> Settings:
+        current = self._snapshot
+        changed = {}
+        for name in Settings.model_fields:
+            value = getattr(new, name)
+            old_value = getattr(current, name)
+            changed[name] = old_value if value == old_value else value
+        if all(changed[name] is getattr(current, name) for name in changed):
+            return current  # 内容未变化，不发布新版本
+        snapshot = Settings.model_construct(**changed)
+        snapshot._version = current.version + 1
+        self._snapshot = snapshot
+        self.publishes += 1
+        return snapshot
+
+    def get_stats(self) -> dict:
+        return {"version": self.version, "publishes": self.publishes}
+
+class SettingsView:
+    """
+    Read-only view of the current snapshot, exported as `settings`
+
+    Each attribute access reads the snapshot published at that moment, so a
+    single `settings.section.field` is always consistent; code reading several
+    fields that must agree should take `config_store.snapshot()` once instead.
+    """
+    __slots__ = ("_store",)
+
+    def __init__(self, store: ConfigStore):
+        object.__setattr__(self, "_store", store)
+
+    def __getattr__(self, name: str):
+        return getattr(self._store.snapshot(), name)
+
+    def __setattr__(self, name: str, value):
+        raise TypeError("配置快照不可修改，请使用 config_store.update()")
+
+def get_config_version() -> int:
+    """Version of the current configuration snapshot"""
+    return config_store.version
+
 # Global settings instance
-settings = Settings.load_from_file() 
\ No newline at end of file
+config_store = ConfigStore(Settings.load_from_file())
+settings = SettingsView(config_store) 
\ No newline at end of file
@@ -0,0 +1,177 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional, Tuple
+from app.core.config import Settings, config_store, get_config_path
+from app.core.config_writer import config_writer, content_digest
+from app.core.logger import logger
+from app.core.log_buffer import log_buffer
+
+try:
+    from watchfiles import awatch
+except ImportError:  # 未安装 watchfiles 时退回到轮询 mtime
+    awatch = None
+
+# listener(old, new): called after a reloaded config has been published
+ConfigListener = Callable[[Settings, Settings], Awaitable[None]]
+
+class ConfigReloader:
+    """
+    Reload config.yaml when it is edited outside the application
+
+    The config directory is watched with watchfiles (inotify and friends)
+    when it is installed, otherwise the file's mtime/size is polled. A
+    changed file is parsed with the same migration and sorting as at
+    startup, validated and published through config_store; an invalid file
+    is rejected with a log entry and the last good config stays live.
+    Writes by ConfigWriter are recognized by their digest and ignored, as
+    are external edits while in-memory changes are still waiting to be
+    written (those win).
+
+    Unchanged sections keep their objects in the new snapshot, so listeners
+    and caches can tell what actually changed with an identity check.
+    """
+
+    POLL_INTERVAL_SECONDS = 2.0
+
+    def __init__(self, config_path: Optional[str] = None):
+        self.config_path = config_path or get_config_path()
+        self._listeners: List[ConfigListener] = []
+        self._task: Optional[asyncio.Task] = None
+        self._stop_event = asyncio.Event()
+        self._loaded_digest: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.mode: Optional[str] = None
+        self.stats = {
+            "changes_seen": 0,
+            "reloads": 0,
+            "unchanged": 0,
+            "rejected": 0,
+            "skipped_pending_writes": 0
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add_listener(self, listener: ConfigListener):
+        self._listeners.append(listener)
+
+    async def start(self):
+        if self.is_running:
+            return
+        self._loaded_digest = (await asyncio.get_running_loop().run_in_executor(None, self._read))[1]
+        self._stop_event = asyncio.Event()
+        if awatch is not None and os.path.isdir(os.path.dirname(self.config_path)):
+            self.mode = "watchfiles"
+            self._task = asyncio.create_task(self._watch_loop())
+        else:
+            self.mode = "polling"
+            self._task = asyncio.create_task(self._poll_loop())
+        logger.info(f"配置文件热重载已启用 ({self.mode}): {self.config_path}")
+
+    async def stop(self):
+        if self._task is not None:
+            # 先让监视线程自行退出，直接取消会留下仍在运行的 watchfiles 线程
+            self._stop_event.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=2)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                pass
+            self._task = None
+
+    async def _watch_loop(self):
+        name = os.path.basename(self.config_path)
+        async for changes in awatch(os.path.dirname(self.config_path), stop_event=self._stop_event,
+                                    debounce=300, recursive=False):
+            if any(os.path.basename(path) == name for _, path in changes):
+                await self._reload_safely()
+
+    async def _poll_loop(self):
+        last = self._stat()
+        while not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.POLL_INTERVAL_SECONDS)
+                break
+            except asyncio.TimeoutError:
+                pass
+            current = self._stat()
+            if current != last:
+                last = current
+                await self._reload_safely()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.config_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read(self) -> Tuple[Optional[bytes], Optional[str]]:
+        try:
+            with open(self.config_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None, None
+        return data, content_digest(data)
+
+    async def _reload_safely(self):
+        try:
+            await self.reload()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"重新加载配置文件时出错: {e}")
+
+    async def reload(self) -> bool:
+        """Re-read config.yaml and publish it if it differs; returns True if a new snapshot was published"""
+        data, digest = await asyncio.get_running_loop().run_in_executor(None, self._read)
+        if data is None or digest in (self._loaded_digest, config_writer.written_digest):
+            return False  # 文件被删除，或内容是自己写入/已加载的
+        self.stats["changes_seen"] += 1
+        if config_writer.is_dirty:
+            # 内存中还有未写出的修改，稍后会覆盖该文件
+            self.stats["skipped_pending_writes"] += 1
+            logger.warning("配置文件被外部修改，但界面修改尚未保存，保留内存中的配置")
+            return False
+
+        try:
+            new = Settings.from_yaml(data.decode('utf-8'))
+        except Exception as e:
+            self.stats["rejected"] += 1
+            self.last_error = str(e)
+            logger.error(f"配置文件无效，保留当前配置: {e}")
+            log_buffer.add_log(f"配置文件无效，已忽略本次修改: {e}", "ERROR")
+            return False
+
+        self._loaded_digest = digest
+        self.last_error = None
+        old = config_store.snapshot()
+        published = config_store.replace(new)
+        config_writer.mark_written(published.version, digest)
+        if published is old:
+            self.stats["unchanged"] += 1
+            return False
+
+        self.stats["reloads"] += 1
+        changed = [name for name in Settings.model_fields if getattr(published, name) is not getattr(old, name)]
+        logger.info(f"配置文件已重新加载: 版本 {published.version}, 变更: {', '.join(changed)}")
+        log_buffer.add_log(f"配置文件已重新加载，变更: {', '.join(changed)}", "INFO")
+        for listener in self._listeners:
+            try:
+                await listener(old, published)
+            except Exception as e:
+                logger.error(f"应用重新加载的配置时出错: {e}")
+        return True
+
+    def get_stats(self) -> dict:
+        """Get hot-reload statistics"""
+        return {
+            **self.stats,
+            "running": self.is_running,
+            "mode": self.mode,
+            "config_path": self.config_path,
+            "last_error": self.last_error
+        }
+
+# Global reloader instance
+config_reloader = ConfigReloader()
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import time
+from typing import Optional
+from app.core.config import config_store, get_config_path, write_config_atomic
+from app.core.logger import logger
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class ConfigWriter:
+    """
+    Write-behind persistence of the published config snapshot
+
+    Callers publish their change through config_store and then call
+    mark_dirty(); the first call starts a short timer and every further call
+    within the window is absorbed, so a burst of edits from the UI costs one
+    YAML dump and one file write. The write serializes the latest snapshot
+    in a worker thread and replaces config.yaml atomically (temp file, fsync,
+    rename). Snapshots already on disk (same version) are not written again.
+    flush() is awaited from the application shutdown hook.
+    """
+
+    def __init__(self, delay_seconds: float = 0.5, config_path: Optional[str] = None):
+        self.delay_seconds = delay_seconds
+        self.config_path = config_path
+        self.written_version = config_store.version  # 启动时文件内容即当前版本
+        self.written_digest: Optional[str] = None  # 最近一次写入内容的 sha256，供热重载识别自身写入
+        self._timer: Optional[asyncio.Task] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+        self.last_write_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.stats = {
+            "requests": 0,
+            "coalesced": 0,
+            "writes": 0,
+            "write_errors": 0
+        }
+
+    @property
+    def is_dirty(self) -> bool:
+        return config_store.version != self.written_version
+
+    def mark_dirty(self):
+        """Schedule a write of the current snapshot (writes synchronously outside an event loop)"""
+        self.stats["requests"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(config_store.snapshot())
+            return
+        if self._timer is not None and not self._timer.done():
+            self.stats["coalesced"] += 1
+            return
+        self._timer = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay_seconds)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Write the current snapshot now if it is not on disk yet"""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            snapshot = config_store.snapshot()
+            if snapshot.version == self.written_version:
+                return
+            await asyncio.get_running_loop().run_in_executor(None, self._write, snapshot)
+
+    def _write(self, snapshot):
+        """Serialize and atomically replace config.yaml (runs in a worker thread)"""
+        if snapshot.version == self.written_version:
+            return
+        path = self.config_path or get_config_path()
+        started = time.monotonic()
+        content = snapshot.dump_yaml()
+        try:
+            write_config_atomic(path, content)
+        except Exception as e:
+            self.stats["write_errors"] += 1
+            self.last_error = str(e)
+            logger.error(f"保存配置文件失败 {path}: {e}")
+            return
+        self.mark_written(snapshot.version, content_digest(content.encode('utf-8')))
+        self.last_write_ms = round((time.monotonic() - started) * 1000, 2)
+        self.last_error = None
+        self.stats["writes"] += 1
+        logger.debug(f"配置已保存: 版本 {snapshot.version}, 耗时 {self.last_write_ms}ms")
+
+    def mark_written(self, version: int, digest: Optional[str]):
+        """Record that the file on disk holds this snapshot version"""
+        self.written_version = version
+        self.written_digest = digest
+
+    def get_stats(self) -> dict:
+        """Get persistence statistics"""
+        return {
+            **self.stats,
+            "dirty": self.is_dirty,
+            "written_version": self.written_version,
+            "config_version": config_store.version,
+            "last_write_ms": self.last_write_ms,
+            "last_error": self.last_error
+        }
+
+# Global writer instance
+config_writer = ConfigWriter()
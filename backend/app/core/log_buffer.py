@@ -1,9 +1,11 @@
 from collections import deque
-from typing import List, Dict, Any
+from itertools import islice
+from typing import List, Dict, Any, Optional
 import time
 import os
 import platform
 import threading
+import uuid
 
 # 设置时区 - 针对不同操作系统
 if platform.system() == "Windows":
@@ -27,11 +29,25 @@ else:
         pass
 
 class LogBuffer:
+    """
+    In-memory ring buffer of UI log entries
+    
+    Entry IDs are consecutive, so the buffer always holds the IDs
+    sequence_id - len(logs) + 1 .. sequence_id and the entries after a given
+    ID are simply the last sequence_id - since_id ones; they are read from
+    the right end of the deque in O(k) without scanning or copying it.
+    
+    `epoch` changes on clear() (and differs for every process), since IDs
+    start from 1 again; clients send the epoch they know and are told to
+    resync when it no longer matches.
+    """
+    
     def __init__(self, max_size: int = 1000):
         self.max_size = max_size
         self.logs = deque(maxlen=max_size)
         self.lock = threading.Lock()
         self.sequence_id = 0
+        self.epoch = uuid.uuid4().hex[:12]
     
     def add_log(self, message: str, level: str = "INFO") -> int:
         """Add a log entry and return its sequence ID"""
@@ -47,26 +63,56 @@ class LogBuffer:
             self.logs.append(log_entry)
             return self.sequence_id
     
+    def _tail(self, count: int) -> List[Dict[str, Any]]:
+        """Last `count` entries in order, O(count) (caller holds the lock)"""
+        count = min(max(count, 0), len(self.logs))
+        if count == 0:
+            return []
+        tail = list(islice(reversed(self.logs), count))
+        tail.reverse()
+        return tail
+    
     def get_logs_since(self, since_id: int = 0) -> List[Dict[str, Any]]:
         """Get all logs since the given sequence ID"""
         with self.lock:
             if since_id == 0:
                 # Return last 50 logs for initial load
-                return list(self.logs)[-50:]
+                return self._tail(50)
             
             # Return logs with ID > since_id
-            return [log for log in self.logs if log["id"] > since_id]
+            return self._tail(self.sequence_id - since_id)
     
     def get_latest_logs(self, count: int = 50) -> List[Dict[str, Any]]:
         """Get the latest N logs"""
         with self.lock:
-            return list(self.logs)[-count:]
+            return self._tail(count)
+    
+    def poll(self, since_id: int = 0, epoch: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """New entries for a polling client
+        
+        When the client's epoch is stale (logs were cleared or the service
+        restarted) or its since_id is ahead of the buffer, `reset` is True and
+        the latest `limit` entries are returned as for an initial load.
+        """
+        with self.lock:
+            reset = (epoch is not None and epoch != self.epoch) or since_id > self.sequence_id
+            if reset or not since_id:
+                logs = self._tail(limit)
+            else:
+                logs = self._tail(self.sequence_id - since_id)
+            return {
+                "logs": logs,
+                "latest_id": self.sequence_id,
+                "epoch": self.epoch,
+                "reset": reset
+            }
     
     def clear(self):
         """Clear all logs"""
         with self.lock:
             self.logs.clear()
             self.sequence_id = 0
+            self.epoch = uuid.uuid4().hex[:12]
 
 # Global log buffer instance
 log_buffer = LogBuffer() 
\ No newline at end of file
@@ -0,0 +1,37 @@
+from collections import deque
+from typing import Optional
+
+class RollingWindow:
+    """Fixed-size window of recent samples with mean/percentile helpers"""
+
+    def __init__(self, size: int = 256):
+        self.samples = deque(maxlen=size)
+        self.total_count = 0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.total_count += 1
+
+    def clear(self):
+        self.samples.clear()
+        self.total_count = 0
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def mean(self) -> Optional[float]:
+        if not self.samples:
+            return None
+        return sum(self.samples) / len(self.samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, pct in [0, 100]"""
+        return self.percentiles(pct)[pct]
+
+    def percentiles(self, *pcts: float) -> dict:
+        """Several percentiles from a single sort"""
+        if not self.samples:
+            return {pct: None for pct in pcts}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {pct: ordered[min(max(int(round(pct / 100.0 * last)), 0), last)] for pct in pcts}
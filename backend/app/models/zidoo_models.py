@@ -1,3 +1,4 @@
+import json
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 
@@ -48,6 +49,57 @@ class ZidooPlayStatus(BaseModel):
     zoom: Optional[ZoomInfo] = None
     threeD: Optional[ThreeDInfo] = None
 
+class LazyPlayStatus:
+    """
+    Lightweight view of a getPlayStatus response
+
+    Only status, video.status and video.path are extracted up front; the
+    pydantic models are validated on first access to `video` / `to_model()`.
+    """
+    __slots__ = ("_data", "status", "msg", "video_status", "video_path", "_video")
+
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+        self.status = int(data["status"])
+        self.msg = data.get("msg")
+        video = data.get("video")
+        if isinstance(video, dict):
+            self.video_status = video.get("status")
+            self.video_path = video.get("path")
+        else:
+            self.video_status = None
+            self.video_path = None
+        self._video = None
+
+    @classmethod
+    def from_bytes(cls, body: bytes) -> "LazyPlayStatus":
+        return cls(json.loads(body))
+
+    @property
+    def has_video(self) -> bool:
+        return isinstance(self._data.get("video"), dict)
+
+    @property
+    def video(self) -> Optional[VideoInfo]:
+        """Fully validated video info, built on demand"""
+        if self._video is None and self.has_video:
+            self._video = VideoInfo(**self._data["video"])
+        return self._video
+
+    def get_video_field(self, key: str, default: Any = None) -> Any:
+        """Read a raw video field without model validation"""
+        video = self._data.get("video")
+        if not isinstance(video, dict):
+            return default
+        return video.get(key, default)
+
+    def to_model(self) -> ZidooPlayStatus:
+        return ZidooPlayStatus(**self._data)
+
+    @property
+    def raw(self) -> Dict[str, Any]:
+        return self._data
+
 class NotificationPayload(BaseModel):
     file_path: str
 
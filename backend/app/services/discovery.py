@@ -0,0 +1,154 @@
+import asyncio
+import ipaddress
+import time
+import httpx
+from typing import Dict, List, Optional
+from app.core.config import settings, ZIDOO_PORT
+from app.core.logger import logger
+
+PLAY_STATUS_PATH = "/ZidooVideoPlay/getPlayStatus"
+MODEL_PATH = "/ZidooControlCenter/getModel"
+
+def normalize_mac(mac: Optional[str]) -> Optional[str]:
+    """Lower-case, colon-separated MAC address (None if empty)"""
+    if not mac:
+        return None
+    return mac.strip().lower().replace('-', ':')
+
+class ZidooDiscovery:
+    """
+    Scan a CIDR for Zidoo players answering the play-status API on port 9529
+
+    Hosts are probed concurrently (bounded by discovery.concurrency) with a
+    short connect timeout, so a /24 completes in about
+    254 / concurrency * connect_timeout seconds. Each responding host is
+    asked for its model and MAC so devices can be followed across DHCP
+    address changes. The last scan is cached for discovery.cache_ttl_seconds.
+    """
+
+    def __init__(self):
+        self.results: Dict[str, dict] = {}  # ip -> device info
+        self.last_scan_at: Optional[float] = None
+        self.last_scan_seconds: Optional[float] = None
+        self.last_cidr: Optional[str] = None
+        self._scan_lock = asyncio.Lock()
+        self.stats = {
+            "scans": 0,
+            "hosts_probed": 0,
+            "cache_hits": 0
+        }
+
+    @staticmethod
+    def get_default_cidr() -> Optional[str]:
+        """discovery.cidr, or the /24 around the first configured device"""
+        if settings.discovery.cidr:
+            return settings.discovery.cidr
+        names = settings.get_device_names()
+        device = settings.get_device(names[0]) if names else None
+        if device is None or not device.ip:
+            return None
+        try:
+            return str(ipaddress.ip_network(f"{device.ip}/24", strict=False))
+        except ValueError:
+            return None
+
+    def is_fresh(self, cidr: str) -> bool:
+        return (self.last_scan_at is not None and self.last_cidr == cidr
+                and time.time() - self.last_scan_at < settings.discovery.cache_ttl_seconds)
+
+    def find_by_mac(self, mac: str) -> Optional[dict]:
+        mac = normalize_mac(mac)
+        for device in self.results.values():
+            if device.get("mac") == mac:
+                return device
+        return None
+
+    async def scan(self, cidr: Optional[str] = None, force: bool = False) -> List[dict]:
+        """Scan `cidr` (default: get_default_cidr()) and return the Zidoo devices found
+
+        Raises:
+            ValueError: if no CIDR is configured or it is invalid/too large
+        """
+        cidr = cidr or self.get_default_cidr()
+        if not cidr:
+            raise ValueError("未配置扫描网段")
+        network = ipaddress.ip_network(cidr, strict=False)
+        if network.num_addresses > 4096:
+            raise ValueError(f"扫描网段过大: {cidr}")
+        cidr = str(network)
+
+        async with self._scan_lock:
+            if not force and self.is_fresh(cidr):
+                self.stats["cache_hits"] += 1
+                return list(self.results.values())
+
+            config = settings.discovery
+            concurrency = max(1, config.concurrency)
+            semaphore = asyncio.Semaphore(concurrency)
+            timeout = httpx.Timeout(config.request_timeout_seconds, connect=config.connect_timeout_seconds)
+            started = time.monotonic()
+            hosts = [str(ip) for ip in network.hosts()] or [str(network.network_address)]
+
+            async with httpx.AsyncClient(timeout=timeout,
+                                         limits=httpx.Limits(max_connections=concurrency,
+                                                             max_keepalive_connections=0)) as client:
+                async def probe(ip: str) -> Optional[dict]:
+                    async with semaphore:
+                        return await self._probe_host(client, ip)
+
+                found = await asyncio.gather(*(probe(ip) for ip in hosts))
+
+            self.results = {device["ip"]: device for device in found if device is not None}
+            self.last_scan_at = time.time()
+            self.last_scan_seconds = round(time.monotonic() - started, 3)
+            self.last_cidr = cidr
+            self.stats["scans"] += 1
+            self.stats["hosts_probed"] += len(hosts)
+            logger.info(f"Zidoo设备扫描完成: {cidr}, 发现 {len(self.results)} 台, 耗时 {self.last_scan_seconds}秒")
+            return list(self.results.values())
+
+    async def _probe_host(self, client: httpx.AsyncClient, ip: str) -> Optional[dict]:
+        base_url = f"http://{ip}:{ZIDOO_PORT}"
+        try:
+            response = await client.get(base_url + PLAY_STATUS_PATH)
+            if response.status_code != 200 or "status" not in response.json():
+                return None
+        except Exception:
+            return None
+
+        device = {"ip": ip, "model": None, "mac": None, "seen_at": time.time()}
+        info = await self.fetch_model(ip, client)
+        if info:
+            device.update(info)
+        return device
+
+    @staticmethod
+    async def fetch_model(ip: str, client: Optional[httpx.AsyncClient] = None) -> Optional[dict]:
+        """Ask a Zidoo for its model name and MAC address (best effort)"""
+        url = f"http://{ip}:{ZIDOO_PORT}{MODEL_PATH}"
+        try:
+            if client is None:
+                async with httpx.AsyncClient(timeout=httpx.Timeout(3.0, connect=1.0)) as own_client:
+                    response = await own_client.get(url)
+            else:
+                response = await client.get(url)
+            data = response.json()
+            if not isinstance(data, dict):
+                raise ValueError(f"unexpected response: {str(data)[:100]}")
+            return {
+                "model": data.get("model"),
+                "mac": normalize_mac(data.get("net_mac") or data.get("wif_mac"))
+            }
+        except Exception as e:
+            logger.debug(f"获取Zidoo型号信息失败 {ip}: {e}")
+            return None
+
+    def get_status(self) -> dict:
+        """Cached scan results and statistics"""
+        return {
+            **self.stats,
+            "cidr": self.last_cidr,
+            "last_scan_at": self.last_scan_at,
+            "last_scan_seconds": self.last_scan_seconds,
+            "devices": list(self.results.values())
+        }
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from app.core.logger import logger
+
+# Event types published by the heartbeat loop
+EVENT_PLAY_STARTED = "play_started"
+EVENT_PLAY_STOPPED = "play_stopped"
+EVENT_DEVICE_OFFLINE = "device_offline"
+EVENT_DEVICE_ONLINE = "device_online"
+
+EVENT_TYPES = (EVENT_PLAY_STARTED, EVENT_PLAY_STOPPED, EVENT_DEVICE_OFFLINE, EVENT_DEVICE_ONLINE)
+
+@dataclass
+class WatcherEvent:
+    """A state change detected by the heartbeat loop"""
+    type: str
+    video_path: Optional[str] = None
+    status: Optional[Any] = None  # LazyPlayStatus for play_started
+    timestamp: float = field(default_factory=time.time)
+    detected_at: float = field(default_factory=time.monotonic)  # for latency measurements
+
+EventHandler = Callable[[WatcherEvent], Awaitable[None]]
+
+class EventBus:
+    """
+    In-process event bus between the heartbeat loop and slow handlers.
+
+    publish() never blocks; a dispatcher task hands events to handlers,
+    each running in its own task with at most max_concurrency in flight.
+    """
+
+    def __init__(self, max_concurrency: int = 2, max_queue_size: int = 100):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max_queue_size
+        self._handlers: Dict[str, List[EventHandler]] = {event_type: [] for event_type in EVENT_TYPES}
+        self._queue: Optional[asyncio.Queue] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._handler_tasks: Set[asyncio.Task] = set()
+        self.stats = {
+            "published": 0,
+            "dropped": 0,
+            "handled": 0,
+            "failed": 0
+        }
+
+    def subscribe(self, event_type: str, handler: EventHandler):
+        """Register a coroutine handler for an event type"""
+        if event_type not in self._handlers:
+            raise ValueError(f"Unknown event type: {event_type}")
+        self._handlers[event_type].append(handler)
+
+    @property
+    def is_running(self) -> bool:
+        return self._dispatcher is not None and not self._dispatcher.done()
+
+    async def start(self):
+        """Start the dispatcher task"""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        """Stop the dispatcher and cancel in-flight handlers"""
+        tasks = list(self._handler_tasks)
+        if self._dispatcher is not None:
+            tasks.append(self._dispatcher)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._handler_tasks.clear()
+        self._dispatcher = None
+        self._queue = None
+
+    def publish(self, event: WatcherEvent) -> bool:
+        """Queue an event without blocking the caller
+
+        Returns:
+            bool: False if the bus is not running or the queue is full
+        """
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            logger.warning(f"事件队列已满，丢弃事件: {event.type}")
+            return False
+        self.stats["published"] += 1
+        return True
+
+    async def _dispatch_loop(self):
+        while True:
+            event = await self._queue.get()
+            for handler in self._handlers.get(event.type, []):
+                # Wait for a free slot so at most max_concurrency handlers run at once
+                await self._semaphore.acquire()
+                task = asyncio.create_task(self._run_handler(handler, event))
+                self._handler_tasks.add(task)
+                task.add_done_callback(self._handler_tasks.discard)
+
+    async def _run_handler(self, handler: EventHandler, event: WatcherEvent):
+        try:
+            await handler(event)
+            self.stats["handled"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"处理事件 {event.type} 时出错: {e}")
+        finally:
+            self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        """Get event bus statistics"""
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._handler_tasks),
+            "max_concurrency": self.max_concurrency
+        }
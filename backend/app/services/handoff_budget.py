@@ -0,0 +1,94 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+class HandoffDeadlineExceeded(Exception):
+    """Raised when a handoff stage runs past the end-to-end deadline"""
+
+    def __init__(self, stage: str, deadline_seconds: float):
+        super().__init__(f"stage '{stage}' exceeded the {deadline_seconds:g}s handoff deadline")
+        self.stage = stage
+        self.deadline_seconds = deadline_seconds
+
+class HandoffBudget:
+    """
+    End-to-end deadline for one play-start handoff
+
+    The budget starts when the play was detected. Every stage (strm, mapping,
+    notify, stop, ...) runs with whatever time is left; an awaited stage that
+    outlives the budget is cancelled. Time spent per stage is recorded so the
+    slow hop can be identified afterwards.
+    A deadline of 0 or less disables the limit, but stages are still timed.
+    """
+
+    def __init__(self, deadline_seconds: float, started_at: Optional[float] = None):
+        self.deadline_seconds = deadline_seconds
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        self.stages: Dict[str, float] = {}  # stage -> seconds spent
+        self.exceeded_stage: Optional[str] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.deadline_seconds > 0
+
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def finish(self):
+        """Freeze the elapsed time once the handoff is over"""
+        if self.finished_at is None:
+            self.finished_at = time.monotonic()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when no deadline is configured"""
+        if not self.enabled:
+            return None
+        return max(self.deadline_seconds - self.elapsed(), 0.0)
+
+    def _record(self, stage: str, started: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + (time.monotonic() - started)
+
+    def _exceeded(self, stage: str) -> HandoffDeadlineExceeded:
+        self.exceeded_stage = stage
+        return HandoffDeadlineExceeded(stage, self.deadline_seconds)
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """Await a stage with the remaining budget, cancelling it on overrun"""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise self._exceeded(stage)
+
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(awaitable, timeout=remaining)
+        except asyncio.TimeoutError:
+            raise self._exceeded(stage) from None
+        finally:
+            self._record(stage, started)
+
+    @contextmanager
+    def measure(self, stage: str):
+        """Time a synchronous stage; it cannot be interrupted, so the deadline is checked afterwards"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record(stage, started)
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise self._exceeded(stage)
+
+    def to_dict(self) -> dict:
+        return {
+            "deadline_seconds": self.deadline_seconds if self.enabled else None,
+            "elapsed_ms": round(self.elapsed() * 1000, 2),
+            "exceeded_stage": self.exceeded_stage,
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+        }
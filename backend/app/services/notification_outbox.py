@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.core.config import settings, get_config_dir
+from app.core.logger import logger
+from app.core.log_buffer import log_buffer
+
+OUTBOX_FILE_NAME = "notification_outbox.jsonl"
+
+# sender(endpoint, file_path) -> HTTP status code (0 for network errors)
+Sender = Callable[[str, str], Awaitable[int]]
+
+class NotificationOutbox:
+    """
+    Durable retry queue for play notifications that could not be delivered
+
+    Failed notifications are appended to a JSONL journal next to config.yaml
+    and retried with exponential backoff by a task of their own, so retries
+    never run on the heartbeat loop. A path already pending for the same
+    endpoint within notification.outbox_dedup_window_seconds is not queued
+    again, and entries older than notification.outbox_max_age_seconds are
+    dropped as stale.
+
+    Journal records (one JSON object per line):
+        {"op": "add", "entry": {...}}
+        {"op": "update", "id": ..., "attempts": n, "next_attempt_at": t, "last_status": code}
+        {"op": "remove", "id": ..., "reason": "delivered" | "stale" | "rejected" | "superseded"}
+    The journal is replayed on start and compacted to its live entries.
+    """
+
+    COMPACT_THRESHOLD = 200  # 日志记录数超过存活条目数加此值时压缩
+
+    def __init__(self, sender: Sender, journal_path: Optional[str] = None):
+        self.sender = sender
+        self.journal_path = journal_path or os.path.join(get_config_dir(), OUTBOX_FILE_NAME)
+        self._entries: Dict[str, dict] = {}  # id -> entry, in insertion order
+        self._journal_records = 0
+        self._io_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "queued": 0,
+            "deduplicated": 0,
+            "delivered": 0,
+            "retries": 0,
+            "dropped_stale": 0,
+            "dropped_rejected": 0,
+            "replayed": 0
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Replay the journal and start the retry task"""
+        if self.is_running:
+            return
+        self._wake = asyncio.Event()
+        async with self._io_lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._replay)
+        self._task = asyncio.create_task(self._retry_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def add(self, file_path: str, endpoint: str, last_status: int = 0) -> bool:
+        """Queue a failed notification
+
+        Returns:
+            bool: False if the outbox is disabled or the entry was deduplicated
+        """
+        if not settings.notification.outbox_enabled:
+            return False
+        now = time.time()
+        window = settings.notification.outbox_dedup_window_seconds
+        records = []
+        for entry in list(self._entries.values()):
+            if entry["file_path"] != file_path or entry["endpoint"] != endpoint:
+                continue
+            if now - entry["created_at"] < window:
+                self.stats["deduplicated"] += 1
+                logger.debug(f"通知重试队列去重: {file_path} -> {endpoint}")
+                return False
+            # 同一路径的旧条目已超出去重窗口，由新的播放事件取代
+            del self._entries[entry["id"]]
+            records.append({"op": "remove", "id": entry["id"], "reason": "superseded"})
+
+        entry = {
+            "id": uuid.uuid4().hex,
+            "file_path": file_path,
+            "endpoint": endpoint,
+            "created_at": now,
+            "attempts": 0,
+            "next_attempt_at": now + self._backoff(0),
+            "last_status": last_status
+        }
+        self._entries[entry["id"]] = entry
+        records.append({"op": "add", "entry": entry})
+        await self._append(records)
+        self.stats["queued"] += 1
+        logger.info(f"通知发送失败，已加入重试队列: {file_path} -> {endpoint}")
+        log_buffer.add_log(f"通知发送失败，已加入重试队列: {file_path}", "WARNING")
+        self._wake.set()
+        return True
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        base = max(settings.notification.outbox_retry_base_seconds, 1)
+        return min(base * (2 ** min(attempts, 16)), max(settings.notification.outbox_retry_max_seconds, base))
+
+    @staticmethod
+    def _due_at(entry: dict) -> float:
+        """Next retry, or the expiry time if that comes first (so stale entries are dropped promptly)"""
+        return min(entry["next_attempt_at"], entry["created_at"] + settings.notification.outbox_max_age_seconds)
+
+    async def _retry_loop(self):
+        while True:
+            if self._entries:
+                delay = min(self._due_at(entry) for entry in self._entries.values()) - time.time()
+            else:
+                delay = None
+            if delay is None or delay > 0:
+                self._wake.clear()
+                # asyncio.wait rather than wait_for: on Python 3.11 wait_for can swallow
+                # a cancel that arrives just as the event fires, and stop() then hangs
+                waiter = asyncio.ensure_future(self._wake.wait())
+                try:
+                    await asyncio.wait({waiter}, timeout=delay)
+                finally:
+                    waiter.cancel()
+                continue
+            try:
+                await self._process_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"处理通知重试队列时出错: {e}")
+                await asyncio.sleep(1)
+
+    async def _process_due(self):
+        now = time.time()
+        max_age = settings.notification.outbox_max_age_seconds
+        due = [entry for entry in self._entries.values() if self._due_at(entry) <= now]
+        for entry in due:
+            if now - entry["created_at"] >= max_age:
+                self.stats["dropped_stale"] += 1
+                logger.warning(f"通知重试条目已过期，丢弃: {entry['file_path']} -> {entry['endpoint']}")
+                await self._remove(entry, "stale")
+                continue
+
+            self.stats["retries"] += 1
+            status_code = await self.sender(entry["endpoint"], entry["file_path"])
+            if 200 <= status_code < 300:
+                self.stats["delivered"] += 1
+                log_buffer.add_log(f"重试通知发送成功: {entry['file_path']}", "INFO")
+                await self._remove(entry, "delivered")
+            elif 400 <= status_code < 500 and status_code != 429:
+                # 远程明确拒绝，重试没有意义
+                self.stats["dropped_rejected"] += 1
+                logger.warning(f"重试通知被拒绝 (HTTP {status_code})，丢弃: {entry['file_path']}")
+                await self._remove(entry, "rejected")
+            else:
+                entry["attempts"] += 1
+                entry["last_status"] = status_code
+                entry["next_attempt_at"] = time.time() + self._backoff(entry["attempts"])
+                await self._append([{"op": "update", "id": entry["id"], "attempts": entry["attempts"],
+                                     "next_attempt_at": entry["next_attempt_at"], "last_status": status_code}])
+
+    async def _remove(self, entry: dict, reason: str):
+        self._entries.pop(entry["id"], None)
+        await self._append([{"op": "remove", "id": entry["id"], "reason": reason}])
+
+    async def _append(self, records: List[dict]):
+        async with self._io_lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_records, records)
+
+    def _write_records(self, records: List[dict]):
+        """Append to the journal, compacting it once dead records dominate (runs in a thread)"""
+        try:
+            if self._journal_records + len(records) > len(self._entries) + self.COMPACT_THRESHOLD:
+                self._compact()
+                return
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_records += len(records)
+        except Exception as e:
+            logger.error(f"写入通知重试队列失败: {e}")
+
+    def _compact(self):
+        """Rewrite the journal with only the live entries"""
+        tmp_path = f"{self.journal_path}.tmp"
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        entries = list(self._entries.values())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps({"op": "add", "entry": entry}, ensure_ascii=False, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self._journal_records = len(entries)
+
+    def _replay(self):
+        """Rebuild pending entries from the journal (runs in a thread)"""
+        if not os.path.exists(self.journal_path):
+            return
+        entries: Dict[str, dict] = {}
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写入中断留下的半行，忽略
+                        continue
+                    op = record.get("op")
+                    if op == "add":
+                        entries[record["entry"]["id"]] = record["entry"]
+                    elif op == "update" and record.get("id") in entries:
+                        entry = entries[record["id"]]
+                        entry["attempts"] = record["attempts"]
+                        entry["next_attempt_at"] = record["next_attempt_at"]
+                        entry["last_status"] = record.get("last_status", 0)
+                    elif op == "remove":
+                        entries.pop(record.get("id"), None)
+            self._entries = entries
+            self.stats["replayed"] = len(entries)
+            self._compact()
+            if entries:
+                logger.info(f"已恢复通知重试队列: {len(entries)} 条待发送")
+        except Exception as e:
+            logger.error(f"加载通知重试队列失败: {e}")
+
+    def get_pending(self) -> List[dict]:
+        """Pending entries, oldest first"""
+        return [dict(entry) for entry in self._entries.values()]
+
+    def get_stats(self) -> dict:
+        """Get outbox statistics"""
+        return {
+            **self.stats,
+            "enabled": settings.notification.outbox_enabled,
+            "running": self.is_running,
+            "pending": len(self._entries),
+            "journal_path": self.journal_path
+        }
@@ -1,55 +1,437 @@
+import asyncio
+import time
 import httpx
-from typing import Optional
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit
 from app.models.zidoo_models import NotificationPayload
 from app.core.config import settings
 from app.core.logger import logger
+from app.core.stats import RollingWindow
+from app.services.notification_outbox import NotificationOutbox
+
+class NotificationResult(NamedTuple):
+    """Outcome of a notification fan-out
+
+    `stop_local` is the fan-out policy's decision: True when the Zidoo should
+    stop local playback, False when it should keep playing.
+    """
+    status_code: int
+    stop_local: bool
+    statuses: Dict[str, int]  # endpoint -> 已返回的状态码
+    pending: Dict[str, asyncio.Task]  # endpoint -> 策略决定后仍在后台发送的任务
+
 
 class NotificationService:
     def __init__(self):
         # 移除初始化时的配置读取，改为每次发送时从内存获取最新配置
-        pass
+        # 每个目标地址 (scheme://host:port) 一个长连接客户端，启动时预热并定期探测保活
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, float]] = {}  # origin -> (client, timeout)
+        self._clients_lock = asyncio.Lock()
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self._health_task: Optional[asyncio.Task] = None
+        # endpoint -> 最近一次探测/通知得到的健康状态，用于在交接前预判远程设备离线
+        self.health: Dict[str, dict] = {}
+        self._send_tasks: Set[asyncio.Task] = set()  # 扇出发送中的任务，策略已决定后其余地址继续在后台完成
+        self.last_status: Dict[str, int] = {}  # endpoint -> 最近一次通知的状态码
+        self.outbox = NotificationOutbox(self._deliver)  # 本机已停止播放但未送达的通知持久化后在独立任务中重试
+        self.latency = RollingWindow(256)
+        self.stats = {
+            "clients_created": 0,
+            "clients_closed": 0,
+            "sent": 0,
+            "probes": 0,
+            "probe_failures": 0,
+            "health_checks": 0
+        }
+    
+    @staticmethod
+    def _get_origin(endpoint: str) -> str:
+        parts = urlsplit(endpoint)
+        return f"{parts.scheme}://{parts.netloc}"
+    
+    @staticmethod
+    def get_endpoints(primary: Optional[str] = None) -> List[str]:
+        """Primary endpoint followed by the extra fan-out endpoints, without duplicates
+        
+        Args:
+            primary: Endpoint routed from the matched mapping; defaults to notification.endpoint
+        """
+        endpoints = []
+        for endpoint in [primary or settings.notification.endpoint, *settings.notification.extra_endpoints]:
+            if endpoint and endpoint not in endpoints:
+                endpoints.append(endpoint)
+        return endpoints
+    
+    @classmethod
+    def get_all_endpoints(cls) -> List[str]:
+        """Every endpoint a notification may go to, including per-mapping routes (for keep-alive)"""
+        endpoints = cls.get_endpoints()
+        for mapping in settings.mapping_paths:
+            if mapping.mapping_type == "media" and mapping.enable and mapping.endpoint \
+                    and mapping.endpoint not in endpoints:
+                endpoints.append(mapping.endpoint)
+        return endpoints
+    
+    async def start(self):
+        """Start the keep-alive task, which opens and warms up the connection right away,
+        the health check task, which takes over the keep-alive probes when enabled,
+        and the outbox retry task when it is enabled"""
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+        if settings.notification.outbox_enabled:
+            await self.outbox.start()
+    
+    async def close(self):
+        """Stop the keep-alive probe, cancel pending fan-out sends and close all pooled clients"""
+        for task in list(self._send_tasks):
+            task.cancel()
+        if self._send_tasks:
+            await asyncio.gather(*self._send_tasks, return_exceptions=True)
+        await self.outbox.stop()
+        for task in (self._keepalive_task, self._health_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._keepalive_task = None
+        self._health_task = None
+        async with self._clients_lock:
+            for origin in list(self._clients):
+                await self._close_client(origin)
+    
+    async def _close_client(self, origin: str):
+        client, _ = self._clients.pop(origin)
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.debug(f"关闭通知连接池时出错: {e}")
+        self.stats["clients_closed"] += 1
+    
+    async def _get_client(self, endpoint: str) -> httpx.AsyncClient:
+        """Return the pooled client for the endpoint, rebuilding it when timeout_seconds changed"""
+        origin = self._get_origin(endpoint)
+        timeout = settings.notification.timeout_seconds
+        existing = self._clients.get(origin)
+        if existing is not None and existing[1] == timeout:
+            return existing[0]
+        
+        async with self._clients_lock:
+            existing = self._clients.get(origin)
+            if existing is not None and existing[1] != timeout:
+                logger.info(f"通知超时配置已变更，重建连接: {origin}")
+                await self._close_client(origin)
+                existing = None
+            if existing is None:
+                # 空闲连接须存活到下一次保活探测或健康检查
+                keepalive = max(settings.notification.keepalive_interval_seconds,
+                                settings.notification.health_check_interval_seconds, 0) + 30
+                client = httpx.AsyncClient(
+                    timeout=timeout,
+                    limits=httpx.Limits(max_connections=4, max_keepalive_connections=2, keepalive_expiry=keepalive)
+                )
+                self._clients[origin] = (client, timeout)
+                self.stats["clients_created"] += 1
+                logger.debug(f"已创建通知连接池: {origin}")
+            return self._clients[origin][0]
+    
+    async def prune_clients(self):
+        """Close clients for endpoints that are no longer configured"""
+        active = {self._get_origin(endpoint) for endpoint in self.get_all_endpoints()}
+        async with self._clients_lock:
+            for origin in [o for o in self._clients if o not in active]:
+                logger.info(f"通知地址已变更，关闭旧连接: {origin}")
+                await self._close_client(origin)
+    
+    async def _probe(self, endpoint: str) -> bool:
+        """Cheap HEAD request that opens/keeps the connection; any HTTP response counts"""
+        self.stats["probes"] += 1
+        try:
+            client = await self._get_client(endpoint)
+            response = await client.head(endpoint, timeout=min(settings.notification.timeout_seconds, 5))
+            self._record_health(endpoint, response.status_code, "keepalive")
+            return True
+        except Exception as e:
+            self.stats["probe_failures"] += 1
+            self._record_health(endpoint, 0, "keepalive")
+            logger.debug(f"通知地址探测失败 {endpoint}: {e}")
+            return False
+    
+    async def _probe_all(self):
+        await asyncio.gather(*(self._probe(endpoint) for endpoint in self.get_all_endpoints()))
+    
+    async def _check_health(self, endpoint: str):
+        """Probe the configured health URL of an endpoint's origin and cache the result"""
+        config = settings.notification
+        url = urljoin(endpoint, config.health_check_path) if config.health_check_path else endpoint
+        self.stats["health_checks"] += 1
+        try:
+            client = await self._get_client(endpoint)
+            response = await client.request(config.health_check_method, url,
+                                            timeout=min(config.timeout_seconds, 5))
+            self._record_health(endpoint, response.status_code, "health_check")
+        except Exception as e:
+            self._record_health(endpoint, 0, "health_check")
+            logger.debug(f"通知地址健康检查失败 {url}: {e}")
+    
+    @staticmethod
+    def _health_check_enabled() -> bool:
+        return settings.notification.health_check_interval_seconds > 0
+    
+    async def _health_loop(self):
+        while True:
+            interval = settings.notification.health_check_interval_seconds
+            if interval > 0:
+                try:
+                    await asyncio.gather(*(self._check_health(endpoint) for endpoint in self.get_all_endpoints()))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.debug(f"通知地址健康检查出错: {e}")
+            await asyncio.sleep(interval if interval > 0 else 30)
+    
+    def _record_health(self, endpoint: str, status_code: int, source: str):
+        """Cache up/down for an endpoint: no response or 503 (remote offline) is down, any other response is up"""
+        state = "down" if status_code in (0, 503) else "up"
+        previous = self.health.get(endpoint)
+        if previous is not None and previous["state"] != state:
+            logger.info(f"通知地址状态变化: {endpoint} {previous['state']} -> {state}")
+        self.health[endpoint] = {
+            "state": state,
+            "status_code": status_code,
+            "source": source,
+            "checked_at": time.time(),
+            "_checked_monotonic": time.monotonic()
+        }
+    
+    def get_health(self, endpoint: str) -> str:
+        """Cached state of an endpoint: up, down, or unknown when never checked or stale"""
+        entry = self.health.get(endpoint)
+        if entry is None:
+            return "unknown"
+        config = settings.notification
+        interval = config.health_check_interval_seconds if config.health_check_interval_seconds > 0 \
+            else config.keepalive_interval_seconds
+        max_age = 3 * (interval if interval > 0 else 30)
+        if time.monotonic() - entry["_checked_monotonic"] > max_age:
+            return "unknown"
+        return entry["state"]
+    
+    def predict_offline(self, endpoint: Optional[str] = None) -> bool:
+        """True if the cached health says the notification would not be accepted
+        
+        Follows the fan-out policy: for primary the primary endpoint must be down,
+        for first_success every endpoint, for all_success any endpoint.
+        """
+        endpoints = self.get_endpoints(endpoint)
+        states = [self.get_health(e) == "down" for e in endpoints]
+        policy = settings.notification.fanout_policy
+        if policy == "first_success":
+            return all(states)
+        if policy == "all_success":
+            return any(states)
+        return states[0] if states else False
+    
+    def get_health_status(self, endpoint: Optional[str] = None) -> dict:
+        """Cached downstream state for the dashboard"""
+        endpoints = self.get_endpoints(endpoint)
+        primary = endpoints[0] if endpoints else None
+        entry = self.health.get(primary) if primary else None
+        return {
+            "endpoint": primary,
+            "state": self.get_health(primary) if primary else "unknown",
+            "checked_at": entry["checked_at"] if entry else None,
+            "endpoints": {
+                e: {
+                    "state": self.get_health(e),
+                    "status_code": info["status_code"],
+                    "source": info["source"],
+                    "checked_at": info["checked_at"]
+                }
+                for e, info in self.health.items()
+            }
+        }
+    
+    async def _keepalive_loop(self):
+        # 启动时立即预热：DNS解析和TCP连接在第一次播放事件之前完成
+        if not self._health_check_enabled():
+            await self._probe_all()
+        while True:
+            interval = settings.notification.keepalive_interval_seconds
+            await asyncio.sleep(interval if interval > 0 else 30)
+            if interval <= 0:
+                continue
+            try:
+                await self.prune_clients()
+                # 健康检查开启时，其请求走同一连接池，既保持连接也更新健康缓存，不再重复探测
+                if not self._health_check_enabled():
+                    await self._probe_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"通知连接保活出错: {e}")
+    
+    async def send_notification(self, file_path: str, endpoint: Optional[str] = None,
+                                strict: bool = False) -> NotificationResult:
+        """Send notification to the configured endpoints
         
-    async def send_notification(self, file_path: str) -> int:
-        """Send notification to external endpoint
+        `endpoint` (the matched mapping's route) replaces notification.endpoint
+        as the primary endpoint; extra endpoints still receive the notification.
+        
+        With extra endpoints configured the notification is sent to all of them
+        concurrently, and notification.fanout_policy decides whether the Zidoo
+        should stop local playback:
+        
+        - primary: the primary endpoint decides; stop unless it answered 503
+          (remote offline), or unless it did not answer 2xx when `strict`
+        - first_success: stop as soon as any endpoint answers 2xx
+        - all_success: stop only if every endpoint answered 2xx
+        
+        The status code is the deciding 2xx, or else 503 if any endpoint
+        answered 503, otherwise the first failure. Sends the policy no longer
+        waits for finish in the background and are listed in `pending`.
         
         Returns:
-            int: HTTP status code from the notification endpoint
+            NotificationResult: status code, stop decision and per-endpoint results
         """
-        # 每次发送时从内存获取最新配置
-        endpoint = settings.notification.endpoint
-        timeout = settings.notification.timeout_seconds
+        endpoints = self.get_endpoints(endpoint)
+        if len(endpoints) == 1:
+            status_code = await self._deliver(endpoints[0], file_path)
+            return NotificationResult(status_code, self._primary_stops(status_code, strict),
+                                      {endpoints[0]: status_code}, {})
+        
+        tasks = [asyncio.create_task(self._deliver(endpoint, file_path)) for endpoint in endpoints]
+        for task in tasks:
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+        
+        policy = settings.notification.fanout_policy
+        try:
+            if policy == "primary":
+                status_code = await tasks[0]
+                stop_local = self._primary_stops(status_code, strict)
+            elif policy == "first_success":
+                status_code, stop_local = 0, False
+                for next_done in asyncio.as_completed(tasks):
+                    code = await next_done
+                    if 200 <= code < 300:
+                        status_code, stop_local = code, True
+                        break
+                if not stop_local:
+                    status_code = self._combine_failures([task.result() for task in tasks])
+            else:
+                status_codes = await asyncio.gather(*tasks)
+                stop_local = all(200 <= code < 300 for code in status_codes)
+                status_code = status_codes[0] if stop_local else self._combine_failures(status_codes)
+        except asyncio.CancelledError:
+            # 交接被取消（例如超出总时限）时，连同未完成的扇出请求一起取消
+            for task in tasks:
+                task.cancel()
+            raise
         
+        statuses = {ep: task.result() for ep, task in zip(endpoints, tasks) if task.done()}
+        pending = {ep: task for ep, task in zip(endpoints, tasks) if not task.done()}
+        return NotificationResult(status_code, stop_local, statuses, pending)
+    
+    @staticmethod
+    def _primary_stops(status_code: int, strict: bool) -> bool:
+        if strict:
+            return 200 <= status_code < 300
+        return status_code != 503
+    
+    @staticmethod
+    def _combine_failures(status_codes: List[int]) -> int:
+        if 503 in status_codes:
+            return 503
+        return next((code for code in status_codes if not 200 <= code < 300), 0)
+    
+    async def queue_undelivered(self, file_path: str, result: NotificationResult):
+        """Queue the endpoints a handoff could not reach in the outbox
+        
+        Only call this once the Zidoo has actually given up local playback: a
+        retry landing while the film still plays locally would start it on a
+        second device. Endpoints that failed with a network error are queued,
+        and so are sends still running in the background if they end the same
+        way. Cancelled sends and HTTP responses, including 503, are not queued.
+        """
+        for endpoint, status_code in result.statuses.items():
+            if status_code == 0:
+                await self.outbox.add(file_path, endpoint)
+        for endpoint, task in result.pending.items():
+            task.add_done_callback(lambda done, endpoint=endpoint: self._queue_if_undelivered(file_path, endpoint, done))
+    
+    def _queue_if_undelivered(self, file_path: str, endpoint: str, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None or task.result() != 0:
+            return
+        add_task = asyncio.create_task(self.outbox.add(file_path, endpoint))
+        self._send_tasks.add(add_task)
+        add_task.add_done_callback(self._send_tasks.discard)
+    
+    async def _deliver(self, endpoint: str, file_path: str) -> int:
+        """POST the notification to one endpoint
+        
+        Returns:
+            int: HTTP status code, or 0 for network/unexpected errors
+        """
         payload = NotificationPayload(file_path=file_path)
         
         try:
             # Add debug logging to show the exact payload being sent
-            logger.debug(f"Sending notification payload: {payload.dict()}")
+            logger.debug(f"Sending notification payload to {endpoint}: {payload.dict()}")
             
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(
-                    endpoint,
-                    json=payload.dict(),
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                # Log the notification result
-                if response.status_code >= 200 and response.status_code < 300:
-                    logger.info(f"Successfully sent notification for {file_path}")
-                    logger.debug(f"Response: {response.status_code} {response.text}")
-                else:
-                    logger.error(f"Failed to send notification: HTTP {response.status_code}")
-                    logger.debug(f"Response: {response.text}")
-                
-                return response.status_code
-                
+            client = await self._get_client(endpoint)
+            started = time.monotonic()
+            response = await client.post(
+                endpoint,
+                json=payload.dict(),
+                headers={"Content-Type": "application/json"}
+            )
+            self.latency.add(time.monotonic() - started)
+            self.stats["sent"] += 1
+            self.last_status[endpoint] = response.status_code
+            self._record_health(endpoint, response.status_code, "notification")
+            
+            # Log the notification result
+            if response.status_code >= 200 and response.status_code < 300:
+                logger.info(f"Successfully sent notification for {file_path} to {endpoint}")
+                logger.debug(f"Response: {response.status_code} {response.text}")
+            else:
+                logger.error(f"Failed to send notification to {endpoint}: HTTP {response.status_code}")
+                logger.debug(f"Response: {response.text}")
+            
+            return response.status_code
+        
         except httpx.RequestError as e:
-            logger.error(f"Request error when sending notification: {e}")
+            logger.error(f"Request error when sending notification to {endpoint}: {e}")
+            self.last_status[endpoint] = 0
+            self._record_health(endpoint, 0, "notification")
             return 0  # Return 0 for network/connection errors
         except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error when sending notification: {e.response.status_code}")
+            logger.error(f"HTTP error when sending notification to {endpoint}: {e.response.status_code}")
+            self.last_status[endpoint] = e.response.status_code
             return e.response.status_code
         except Exception as e:
-            logger.error(f"Unexpected error when sending notification: {e}")
+            logger.error(f"Unexpected error when sending notification to {endpoint}: {e}")
+            self.last_status[endpoint] = 0
             return 0  # Return 0 for unexpected errors
     
- 
\ No newline at end of file
+    def get_stats(self) -> dict:
+        """Get notification connection and latency statistics"""
+        latency = self.latency.percentiles(50, 99)
+        return {
+            **self.stats,
+            "endpoints": self.get_endpoints(),
+            "fanout_policy": settings.notification.fanout_policy,
+            "last_status": dict(self.last_status),
+            "pending_sends": len(self._send_tasks),
+            "pooled_origins": list(self._clients),
+            "outbox": self.outbox.get_stats(),
+            "keepalive_running": self._keepalive_task is not None and not self._keepalive_task.done(),
+            "health": self.get_health_status(),
+            "p50_latency_ms": round(latency[50] * 1000, 2) if latency[50] is not None else None,
+            "p99_latency_ms": round(latency[99] * 1000, 2) if latency[99] is not None else None
+        }
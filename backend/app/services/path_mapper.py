@@ -1,29 +1,73 @@
-from typing import Optional, Tuple
-from app.core.config import settings
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from pydantic import ValidationError
+from app.core.config import Settings, PathMapping, config_store, get_config_version, migrate_mapping_data
 from app.core.logger import logger
+from app.core.lru_cache import LRUCache, MISSING
+from app.services.path_trie import MappingIndex, normalize_path
 import os
 
+class MappingResult(NamedTuple):
+    """Outcome of a media mapping lookup"""
+    mapped_path: Optional[str]
+    message: str
+    endpoint: Optional[str] = None  # 匹配映射的专用通知地址，None 表示使用全局地址
+
+class MappingImportError(ValueError):
+    """A bulk import was rejected; `errors` lists the problem of each bad entry"""
+    
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(f"{len(errors)} 条路径映射无效")
+        self.errors = errors
+
 class PathMapper:
+    # 编译后的前缀树索引，所有 PathMapper 实例共享
+    # 仅在发布的配置快照中 mapping_paths 发生变化时重建
+    _index: Optional[MappingIndex] = None
+    _index_builds = 0
+    # 映射结果缓存，键为 (类型, 输入路径, 配置版本号)，配置变更后旧结果自然失效
+    _result_cache = LRUCache(maxsize=1024)
+    
     def __init__(self):
         pass  # 不再在初始化时读取配置
     
+    @classmethod
+    def _get_index(cls, snapshot: Settings) -> MappingIndex:
+        """Return the compiled index, rebuilding it if the snapshot's mapping list differs"""
+        index = cls._index
+        # 未变化的配置段在快照之间共享，身份比较即可判断映射是否变更
+        if index is None or index.mappings is not snapshot.mapping_paths:
+            index = MappingIndex(snapshot.mapping_paths)
+            cls._index = index
+            cls._index_builds += 1
+            logger.debug(f"已重建路径映射索引: 媒体 {index.media.size} 条, STRM {index.strm.size} 条")
+        return index
+    
+    @classmethod
+    def get_cache_stats(cls) -> dict:
+        """Get mapping result cache statistics"""
+        return {
+            **cls._result_cache.get_stats(),
+            "config_version": get_config_version()
+        }
+    
+    @classmethod
+    def get_index_stats(cls) -> dict:
+        """Get compiled index statistics"""
+        index = cls._index
+        return {
+            "builds": cls._index_builds,
+            "compiled": index is not None,
+            "media_entries": index.media.size if index else 0,
+            "strm_entries": index.strm.size if index else 0
+        }
+    
     def _normalize_path(self, path: str) -> str:
         """
         标准化路径，确保路径格式一致
         - 统一使用正斜杠
         - 移除多余的斜杠
         """
-        if not path:
-            return path
-        
-        # 统一使用正斜杠
-        normalized = path.replace('\\', '/')
-        
-        # 移除多余的斜杠
-        while '//' in normalized:
-            normalized = normalized.replace('//', '/')
-        
-        return normalized
+        return normalize_path(path)
     
     def _ensure_trailing_slash(self, path: str, is_directory: bool = True) -> str:
         """
@@ -41,100 +85,9 @@ class PathMapper:
         
         return normalized
     
-    def _smart_path_replace(self, original_path: str, source: str, target: str) -> str:
-        """
-        智能路径替换，处理斜杠兼容性问题
-        支持多种斜杠组合的自动匹配和修复
-        """
-        # 标准化所有路径
-        original_normalized = self._normalize_path(original_path)
-        source_normalized = self._normalize_path(source)
-        target_normalized = self._normalize_path(target)
-        
-        logger.debug(f"标准化路径: 原始={original_normalized}, 源={source_normalized}, 目标={target_normalized}")
-        
-        # 生成所有可能的源路径变体
-        source_variants = []
-        
-        # 1. 原始标准化路径
-        source_variants.append(source_normalized)
-        
-        # 2. 带末尾斜杠的版本
-        if not source_normalized.endswith('/'):
-            source_variants.append(source_normalized + '/')
-        
-        # 3. 不带末尾斜杠的版本
-        if source_normalized.endswith('/'):
-            source_variants.append(source_normalized.rstrip('/'))
-        
-        # 4. 处理原始路径中可能缺少斜杠的情况
-        # 例如：/storage/emulated/0/CloudDrive/115电影 -> /storage/emulated/0/CloudDrive/115/电影
-        if '/' in source_normalized:
-            parts = source_normalized.split('/')
-            if len(parts) > 1:
-                # 尝试在最后一个目录后添加斜杠
-                base_path = '/'.join(parts[:-1])
-                last_part = parts[-1]
-                if last_part and not last_part.endswith('/'):
-                    # 检查是否原始路径中缺少了斜杠
-                    potential_missing_slash = base_path + '/' + last_part + '/'
-                    source_variants.append(potential_missing_slash)
-        
-        # 确保目标路径有末尾斜杠
-        if not target_normalized.endswith('/'):
-            target_normalized += '/'
-        
-        # 尝试所有源路径变体
-        for source_variant in source_variants:
-            if original_normalized.startswith(source_variant):
-                remaining_path = original_normalized[len(source_variant):]
-                
-                # 确保remaining_path格式正确
-                if remaining_path and not remaining_path.startswith('/'):
-                    remaining_path = '/' + remaining_path
-                
-                # 构建最终结果，避免双斜杠
-                if target_normalized.endswith('/') and remaining_path.startswith('/'):
-                    # 如果目标路径以斜杠结尾，remaining_path也以斜杠开头，则移除一个斜杠
-                    result = target_normalized + remaining_path[1:]
-                else:
-                    result = target_normalized + remaining_path
-                
-                logger.debug(f"路径替换成功: {original_normalized} -> {result} (使用变体: {source_variant})")
-                return result
-        
-        # 特殊处理：检查是否原始路径中缺少了斜杠
-        # 例如：/storage/emulated/0/CloudDrive/115电影/... -> /storage/emulated/0/CloudDrive/115/电影/...
-        if '/' in source_normalized:
-            parts = source_normalized.split('/')
-            if len(parts) > 1:
-                base_path = '/'.join(parts[:-1])
-                last_part = parts[-1]
-                
-                # 检查原始路径是否在base_path后直接跟着last_part（缺少斜杠）
-                potential_pattern = base_path + '/' + last_part
-                if original_normalized.startswith(potential_pattern):
-                    # 找到匹配，需要插入斜杠
-                    remaining_path = original_normalized[len(potential_pattern):]
-                    if remaining_path and not remaining_path.startswith('/'):
-                        remaining_path = '/' + remaining_path
-                    
-                    # 构建最终结果，避免双斜杠
-                    if target_normalized.endswith('/') and remaining_path.startswith('/'):
-                        # 如果目标路径以斜杠结尾，remaining_path也以斜杠开头，则移除一个斜杠
-                        result = target_normalized + remaining_path[1:]
-                    else:
-                        result = target_normalized + remaining_path
-                    
-                    logger.debug(f"路径替换（修复缺少斜杠）: {original_normalized} -> {result}")
-                    return result
-        
-        logger.debug(f"未找到匹配的路径映射: {original_normalized}")
-        return None
-
     def _get_current_mappings(self):
         """获取当前最新的路径映射配置 - 直接从内存读取，不重新加载文件"""
-        return settings.mapping_paths
+        return config_store.snapshot().mapping_paths
     
     def _sort_mappings(self, mappings):
         """Sort mappings: media type first, then strm type"""
@@ -143,6 +96,11 @@ class PathMapper:
             return 0 if mapping.mapping_type == "media" else 1
         
         return sorted(mappings, key=sort_key)
+    
+    @staticmethod
+    def _sort_mapping_dicts(mappings):
+        """Same order as _sort_mappings, for the plain dicts handled inside config_store.update()"""
+        return sorted(mappings, key=lambda mapping: 0 if mapping["mapping_type"] == "media" else 1)
 
     def check_path_mapping_status(self, original_path: str) -> Tuple[Optional[str], str]:
         """
@@ -150,37 +108,44 @@ class PathMapper:
         Only uses media type mappings (mapping_type == "media")
         Returns: (mapped_path, status_message)
         """
+        result = self.resolve_media_path(original_path)
+        return result.mapped_path, result.message
+    
+    def resolve_media_path(self, original_path: str) -> MappingResult:
+        """
+        Resolve a media path to its mapped path and notification endpoint
+        
+        The endpoint comes from the same trie match that produces the mapped
+        path, so per-mapping routing costs no extra lookup.
+        """
         if not original_path:
-            return None, "路径为空"
+            return MappingResult(None, "路径为空")
             
         logger.debug(f"检查路径映射状态: {original_path}")
         
-        # 每次检查时都重新获取最新配置
-        current_mappings = self._get_current_mappings()
-        disabled_matches = []
+        snapshot = config_store.snapshot()
+        index = self._get_index(snapshot)
+        cache_key = ("media", original_path, snapshot.version)
+        cached = self._result_cache.get(cache_key)
+        if cached is not MISSING:
+            logger.debug(f"路径映射缓存命中: {original_path}")
+            return cached
+        
+        result = self._lookup_media(index, original_path)
+        self._result_cache.put(cache_key, result)
+        return result
+    
+    def _lookup_media(self, index: MappingIndex, original_path: str) -> MappingResult:
+        """Resolve a media mapping through the compiled index (uncached)"""
+        match, disabled_mappings = index.media.lookup(original_path)
         
-        for mapping in current_mappings:
-            # Only process media type mappings
-            if mapping.mapping_type != "media":
-                continue
-                
-            source = mapping.source
-            target = mapping.target
-            
-            if not target:
-                continue
-            
-            # 使用智能路径替换
-            mapped_path = self._smart_path_replace(original_path, source, target)
-            
-            if mapped_path is not None:
-                if mapping.enable:
-                    # Found enabled mapping
-                    logger.info(f"路径已映射: {original_path} -> {mapped_path}")
-                    return mapped_path, f"成功映射: {source} -> {target}"
-                else:
-                    # Found disabled mapping
-                    disabled_matches.append(source)
+        if match is not None:
+            # Found enabled mapping
+            mapping = match.mapping
+            logger.info(f"路径已映射: {original_path} -> {match.mapped_path}")
+            return MappingResult(match.mapped_path, f"成功映射: {mapping.source} -> {mapping.target}", mapping.endpoint)
+        
+        disabled_matches = [mapping.source for mapping in disabled_mappings]
         
         # No enabled mapping found
         if disabled_matches:
@@ -193,10 +158,10 @@ class PathMapper:
             status_msg = f"未找到匹配的路径映射"
             logger.warning(f"未找到路径映射: {original_path}")
             
-        return None, status_msg
+        return MappingResult(None, status_msg)
 
     def add_mapping(self, source: str, mapping_type: str = "media", target: Optional[str] = None, 
-                    enable: bool = True):
+                    enable: bool = True, endpoint: Optional[str] = None):
         """Add a new path mapping
         
         Args:
@@ -204,13 +169,13 @@ class PathMapper:
             mapping_type: Type of mapping - "media" or "strm"
             target: Target path - for media: BlurayPoster path; for STRM: actual file system path
             enable: Whether the mapping is enabled
+            endpoint: Notification endpoint for this media mapping (None uses notification.endpoint)
         """
-        from app.core.config import PathMapping
-        
         if not target:
             raise ValueError("Target path is required")
         
-        new_mapping = PathMapping(source=source, mapping_type=mapping_type, target=target, enable=enable)
+        new_mapping = PathMapping(source=source, mapping_type=mapping_type, target=target, enable=enable,
+                                  endpoint=endpoint if mapping_type == "media" else None)
         
         if mapping_type == "media":
             logger.info(f"已添加媒体路径映射: {source} -> {target} (启用: {enable})")
@@ -219,11 +184,10 @@ class PathMapper:
         else:
             raise ValueError(f"Invalid mapping_type: {mapping_type}. Must be 'media' or 'strm'")
         
-        current_mappings = self._get_current_mappings()
-        current_mappings.append(new_mapping)
-        # Sort mappings: media first, then strm
-        sorted_mappings = self._sort_mappings(current_mappings)
-        settings.mapping_paths = sorted_mappings
+        def mutate(data):
+            # Sort mappings: media first, then strm
+            data["mapping_paths"] = self._sort_mapping_dicts(data["mapping_paths"] + [new_mapping.model_dump()])
+        config_store.update(mutate)
     
     def remove_mapping(self, source: str, mapping_type: Optional[str] = None, 
                       target: Optional[str] = None):
@@ -234,29 +198,37 @@ class PathMapper:
             mapping_type: Type of mapping (optional, for more precise matching)
             target: Target path (optional, for more precise matching)
         """
-        current_mappings = self._get_current_mappings()
-        # 使用智能匹配，不依赖精确的路径格式
-        for i, mapping in enumerate(current_mappings):
-            # Match by source first
-            if self._normalize_path(mapping.source) != self._normalize_path(source):
-                continue
-            
-            # If mapping_type is provided, match it
-            if mapping_type and mapping.mapping_type != mapping_type:
-                continue
-            
-            # Match by target if provided
-            if target and self._normalize_path(mapping.target or "") == self._normalize_path(target):
-                del current_mappings[i]
-                settings.mapping_paths = current_mappings
-                logger.info(f"已删除路径映射: {source} -> {target}")
-                return
-        
-        logger.warning(f"未找到路径映射: {source}")
+        removed = False
+        
+        def mutate(data):
+            nonlocal removed
+            mappings = data["mapping_paths"]
+            # 使用智能匹配，不依赖精确的路径格式
+            for i, mapping in enumerate(mappings):
+                # Match by source first
+                if self._normalize_path(mapping["source"]) != self._normalize_path(source):
+                    continue
+                
+                # If mapping_type is provided, match it
+                if mapping_type and mapping["mapping_type"] != mapping_type:
+                    continue
+                
+                # Match by target if provided
+                if target and self._normalize_path(mapping["target"] or "") == self._normalize_path(target):
+                    del mappings[i]
+                    removed = True
+                    return
+        
+        config_store.update(mutate)
+        if removed:
+            logger.info(f"已删除路径映射: {source} -> {target}")
+        else:
+            logger.warning(f"未找到路径映射: {source}")
     
     def update_mapping(self, old_source: str, old_mapping_type: Optional[str] = None, 
                       old_target: Optional[str] = None,
-                      new_source: Optional[str] = None, new_target: Optional[str] = None):
+                      new_source: Optional[str] = None, new_target: Optional[str] = None,
+                      new_endpoint: Optional[str] = None):
         """Update a path mapping in place (preserves order)
         
         Args:
@@ -265,43 +237,49 @@ class PathMapper:
             old_target: Original target path (optional, for more precise matching)
             new_source: New source path (if None, keeps original)
             new_target: New target path (if None, keeps original)
+            new_endpoint: New notification endpoint (if None, keeps original; "" clears it)
         """
-        from app.core.config import PathMapping
+        updated_source = None
+        
+        def mutate(data):
+            nonlocal updated_source
+            mappings = data["mapping_paths"]
+            # 使用智能匹配，不依赖精确的路径格式
+            for mapping in mappings:
+                # Match by source first
+                if self._normalize_path(mapping["source"]) != self._normalize_path(old_source):
+                    continue
+                
+                # If mapping_type is provided, match it
+                if old_mapping_type and mapping["mapping_type"] != old_mapping_type:
+                    continue
+                
+                # Match by target if provided
+                if old_target and self._normalize_path(mapping["target"] or "") != self._normalize_path(old_target):
+                    continue
+                
+                # Found the mapping - update it in the new snapshot (preserves order)
+                updated_source = new_source if new_source is not None else mapping["source"]
+                updated_target = new_target if new_target is not None else mapping["target"]
+                
+                if not updated_target:
+                    raise ValueError("Target path cannot be empty")
+                
+                mapping["source"] = updated_source
+                mapping["target"] = updated_target
+                if new_endpoint is not None and mapping["mapping_type"] == "media":
+                    mapping["endpoint"] = new_endpoint or None
+                # mapping_type and enable remain unchanged
+                
+                # Re-sort to maintain order (in case type changed, though it shouldn't)
+                data["mapping_paths"] = self._sort_mapping_dicts(mappings)
+                return
         
-        current_mappings = self._get_current_mappings()
-        # 使用智能匹配，不依赖精确的路径格式
-        for i, mapping in enumerate(current_mappings):
-            # Match by source first
-            if self._normalize_path(mapping.source) != self._normalize_path(old_source):
-                continue
-            
-            # If mapping_type is provided, match it
-            if old_mapping_type and mapping.mapping_type != old_mapping_type:
-                continue
-            
-            # Match by target if provided
-            if old_target and self._normalize_path(mapping.target or "") != self._normalize_path(old_target):
-                continue
-            
-            # Found the mapping - update it in place
-            updated_source = new_source if new_source is not None else mapping.source
-            updated_target = new_target if new_target is not None else mapping.target
-            
-            if not updated_target:
-                raise ValueError("Target path cannot be empty")
-            
-            # Update the mapping in place
-            mapping.source = updated_source
-            mapping.target = updated_target
-            # mapping_type and enable remain unchanged
-            
-            # Re-sort to maintain order (in case type changed, though it shouldn't)
-            sorted_mappings = self._sort_mappings(current_mappings)
-            settings.mapping_paths = sorted_mappings
+        config_store.update(mutate)
+        if updated_source is not None:
             logger.info(f"已更新路径映射: {old_source} -> {updated_source}")
-            return
-        
-        logger.warning(f"未找到路径映射: {old_source}")
+        else:
+            logger.warning(f"未找到路径映射: {old_source}")
     
     def toggle_mapping(self, source: str, mapping_type: Optional[str] = None,
                       target: Optional[str] = None, enable: bool = True):
@@ -313,25 +291,110 @@ class PathMapper:
             target: Target path (optional, for more precise matching)
             enable: Enable/disable status
         """
-        current_mappings = self._get_current_mappings()
-        # 使用智能匹配，不依赖精确的路径格式
-        for mapping in current_mappings:
-            # Match by source first
-            if self._normalize_path(mapping.source) != self._normalize_path(source):
+        toggled = False
+        
+        def mutate(data):
+            nonlocal toggled
+            # 使用智能匹配，不依赖精确的路径格式
+            for mapping in data["mapping_paths"]:
+                # Match by source first
+                if self._normalize_path(mapping["source"]) != self._normalize_path(source):
+                    continue
+                
+                # If mapping_type is provided, match it
+                if mapping_type and mapping["mapping_type"] != mapping_type:
+                    continue
+                
+                # Match by target if provided
+                if target and self._normalize_path(mapping["target"] or "") == self._normalize_path(target):
+                    mapping["enable"] = enable
+                    toggled = True
+                    return
+        
+        config_store.update(mutate)
+        if toggled:
+            logger.info(f"路径映射状态已切换: {source} -> {target} (启用: {enable})")
+        else:
+            logger.warning(f"未找到路径映射: {source}")
+    
+    def import_mappings(self, mappings: List[Any], mode: str = "replace", dry_run: bool = False) -> Dict[str, int]:
+        """Apply a whole set of mappings as one config snapshot
+        
+        Every entry is validated (old-format entries are migrated as when
+        loading config.yaml) before anything changes, so either all entries
+        are applied or none. The compiled index is rebuilt once afterwards.
+        
+        Args:
+            mappings: mapping dicts (source, mapping_type, target, enable, endpoint)
+            mode: "replace" makes the list the new mapping set; "merge" replaces
+                mappings with the same source and type and appends the rest
+            dry_run: validate and count only
+        
+        Raises:
+            MappingImportError: if any entry is invalid or duplicated
+        """
+        if mode not in ("replace", "merge"):
+            raise ValueError(f"Invalid mode: {mode}. Must be 'replace' or 'merge'")
+        
+        errors = []
+        validated = []
+        seen = {}
+        for i, raw in enumerate(mappings):
+            if not isinstance(raw, dict):
+                errors.append({"index": i, "error": "映射必须是对象"})
                 continue
-            
-            # If mapping_type is provided, match it
-            if mapping_type and mapping.mapping_type != mapping_type:
+            try:
+                data = migrate_mapping_data([dict(raw)])[0]
+                mapping = PathMapping.model_validate(data)
+            except ValidationError as e:
+                message = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" if err['loc'] else err['msg']
+                                    for err in e.errors())
+                errors.append({"index": i, "source": raw.get("source"), "error": message})
                 continue
-            
-            # Match by target if provided
-            if target and self._normalize_path(mapping.target or "") == self._normalize_path(target):
-                mapping.enable = enable
-                settings.mapping_paths = current_mappings
-                logger.info(f"路径映射状态已切换: {source} -> {target} (启用: {enable})")
-                return
-        
-        logger.warning(f"未找到路径映射: {source}")
+            if mapping.mapping_type == "strm" and mapping.endpoint:
+                mapping = mapping.model_copy(update={"endpoint": None})
+            key = self._mapping_key(mapping.source, mapping.mapping_type)
+            if key in seen:
+                errors.append({"index": i, "source": mapping.source, "error": f"与第 {seen[key]} 条重复"})
+                continue
+            seen[key] = i
+            validated.append(mapping.model_dump())
+        if errors:
+            raise MappingImportError(errors)
+        
+        result = {"imported": len(validated), "added": 0, "updated": 0, "total": 0}
+        
+        def mutate(data):
+            if mode == "replace":
+                merged = validated
+                result["added"] = len(validated)
+            else:
+                merged = list(data["mapping_paths"])
+                positions = {self._mapping_key(m["source"], m["mapping_type"]): i for i, m in enumerate(merged)}
+                for mapping in validated:
+                    position = positions.get(self._mapping_key(mapping["source"], mapping["mapping_type"]))
+                    if position is None:
+                        merged.append(mapping)
+                        result["added"] += 1
+                    else:
+                        merged[position] = mapping
+                        result["updated"] += 1
+            data["mapping_paths"] = self._sort_mapping_dicts(merged)
+            result["total"] = len(merged)
+        
+        if dry_run:
+            mutate(config_store.snapshot().model_dump())
+            return result
+        
+        snapshot = config_store.update(mutate)
+        # 导入后立即重建一次索引，首次播放时无需再编译
+        self._get_index(snapshot)
+        logger.info(f"已批量导入路径映射 ({mode}): 导入 {result['imported']} 条, 新增 {result['added']}, "
+                    f"更新 {result['updated']}, 共 {result['total']} 条")
+        return result
+    
+    def _mapping_key(self, source: str, mapping_type: str) -> Tuple[str, str]:
+        return self._normalize_path(source), mapping_type
     
     def get_all_mappings(self):
         """Get all current path mappings (sorted: media first, then strm)"""
@@ -342,7 +405,8 @@ class PathMapper:
             "source": m.source, 
             "mapping_type": m.mapping_type,
             "target": m.target, 
-            "enable": m.enable
+            "enable": m.enable,
+            "endpoint": m.endpoint
         } for m in sorted_mappings]
     
     def map_to_strm_path(self, zidoo_path: str) -> Optional[str]:
@@ -362,28 +426,20 @@ class PathMapper:
         
         logger.debug(f"Mapping Zidoo path to STRM file system path: {zidoo_path}")
         
-        current_mappings = self._get_current_mappings()
+        snapshot = config_store.snapshot()
+        index = self._get_index(snapshot)
+        cache_key = ("strm", zidoo_path, snapshot.version)
+        cached = self._result_cache.get(cache_key)
+        if cached is not MISSING:
+            logger.debug(f"STRM路径映射缓存命中: {zidoo_path}")
+            return cached
         
-        for mapping in current_mappings:
-            # Only process STRM type mappings
-            if mapping.mapping_type != "strm":
-                continue
-                
-            if not mapping.enable:
-                continue
-            
-            if not mapping.target:
-                continue
-            
-            source = mapping.source
-            strm_path = mapping.target  # For STRM mappings, target contains the STRM file system path
-            
-            # Use smart path replace to map source -> strm_path
-            mapped_path = self._smart_path_replace(zidoo_path, source, strm_path)
-            
-            if mapped_path is not None:
-                logger.info(f"STRM路径已映射: {zidoo_path} -> {mapped_path}")
-                return mapped_path
+        match, _ = index.strm.lookup(zidoo_path)
+        mapped_path = match.mapped_path if match is not None else None
+        self._result_cache.put(cache_key, mapped_path)
         
-        logger.debug(f"未找到STRM路径映射: {zidoo_path}")
-        return None 
\ No newline at end of file
+        if mapped_path is not None:
+            logger.info(f"STRM路径已映射: {zidoo_path} -> {mapped_path}")
+        else:
+            logger.debug(f"未找到STRM路径映射: {zidoo_path}")
+        return mapped_path 
\ No newline at end of file
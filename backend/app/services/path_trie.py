@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional, Tuple
+
+def normalize_path(path: str) -> str:
+    """Unify slashes and collapse duplicate separators"""
+    if not path:
+        return path
+    normalized = path.replace('\\', '/')
+    while '//' in normalized:
+        normalized = normalized.replace('//', '/')
+    return normalized
+
+def replace_prefix(normalized_path: str, prefix_key: str, target: str) -> str:
+    """
+    Replace `prefix_key` at the start of `normalized_path` with `target`
+
+    Same rules as PathMapper._smart_path_replace: the prefix is matched on
+    the raw string, and a missing separator after it is inserted
+    (/CloudDrive/115电影 with source /CloudDrive/115 -> target/电影).
+    """
+    remaining_path = normalized_path[len(prefix_key):]
+    if remaining_path and not remaining_path.startswith('/'):
+        remaining_path = '/' + remaining_path
+
+    target_normalized = normalize_path(target)
+    if not target_normalized.endswith('/'):
+        target_normalized += '/'
+
+    if remaining_path.startswith('/'):
+        return target_normalized + remaining_path[1:]
+    return target_normalized + remaining_path
+
+class _TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.entries: List[Tuple[int, object]] = []  # (order, mapping)
+
+class TrieMatch:
+    """Result of a longest-prefix lookup"""
+    __slots__ = ("mapping", "mapped_path", "prefix_key")
+
+    def __init__(self, mapping, mapped_path: str, prefix_key: str):
+        self.mapping = mapping
+        self.mapped_path = mapped_path
+        self.prefix_key = prefix_key
+
+class PathPrefixTrie:
+    """
+    Character-level longest-prefix index over mapping sources
+
+    Sources are keyed by their normalized form without trailing slashes, so
+    a lookup walks the input path once: O(len(path)) regardless of how many
+    mappings exist. Disabled mappings are kept in the trie so lookups can
+    report which disabled rules would have matched.
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self.size = 0
+
+    @staticmethod
+    def make_key(source: str) -> str:
+        return normalize_path(source or "").rstrip('/')
+
+    def insert(self, mapping, order: int):
+        node = self._root
+        for char in self.make_key(mapping.source):
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+        node.entries.append((order, mapping))
+        self.size += 1
+
+    def lookup(self, path: str) -> Tuple[Optional[TrieMatch], List[object]]:
+        """
+        Find the longest enabled source that prefixes `path`
+
+        Returns:
+            (match, disabled): match is None if no enabled mapping matched;
+            disabled lists disabled mappings that prefix the path, in config order
+        """
+        normalized = normalize_path(path)
+        node = self._root
+        best_entry = None
+        best_depth = 0
+        disabled = []
+
+        depth = 0
+        while True:
+            if node.entries:
+                enabled = None
+                for order, mapping in node.entries:
+                    if mapping.enable:
+                        if enabled is None:
+                            enabled = mapping
+                    else:
+                        disabled.append((order, mapping))
+                if enabled is not None:
+                    best_entry = enabled
+                    best_depth = depth
+            if depth >= len(normalized):
+                break
+            node = node.children.get(normalized[depth])
+            if node is None:
+                break
+            depth += 1
+
+        disabled_mappings = [mapping for _, mapping in sorted(disabled, key=lambda item: item[0])]
+        if best_entry is None:
+            return None, disabled_mappings
+
+        prefix_key = normalized[:best_depth]
+        mapped_path = replace_prefix(normalized, prefix_key, best_entry.target)
+        return TrieMatch(best_entry, mapped_path, prefix_key), disabled_mappings
+
+class MappingIndex:
+    """Compiled media/strm tries for one `settings.mapping_paths` list"""
+
+    def __init__(self, mappings):
+        self.mappings = mappings
+        self.media = PathPrefixTrie()
+        self.strm = PathPrefixTrie()
+        for order, mapping in enumerate(mappings):
+            if not mapping.target:
+                continue
+            if mapping.mapping_type == "strm":
+                self.strm.insert(mapping, order)
+            else:
+                self.media.insert(mapping, order)
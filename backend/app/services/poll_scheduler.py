@@ -0,0 +1,122 @@
+import random
+from typing import Optional
+from app.core.config import settings, clamp_heart_rate, GeneralConfig
+from app.core.stats import RollingWindow
+
+class PollScheduler:
+    """
+    Pick the heartbeat interval from the player state
+
+    - idle: not playing, or a handoff is still deciding -> heart_rate, fast
+    - playing: the handoff left a video playing locally (not mapped, remote
+      offline, notification not accepted) -> playing_heart_rate, slow
+    - offline: device offline / API error -> exponential backoff with jitter,
+      starting at heart_rate and capped at offline_heart_rate_max
+    """
+
+    STATE_IDLE = "idle"
+    STATE_PLAYING = "playing"
+    STATE_OFFLINE = "offline"
+
+    JITTER = 0.2  # ±20%
+
+    def __init__(self):
+        self.state = self.STATE_IDLE
+        self.offline_streak = 0
+        self.current_interval_ms = clamp_heart_rate("heart_rate", settings.general.heart_rate)
+
+    def reset(self):
+        """Return to the idle state (used when the watcher starts)"""
+        self.state = self.STATE_IDLE
+        self.offline_streak = 0
+
+    def observe(self, connectivity_state: str, playing_locally: bool):
+        """Update the scheduler state after a poll
+        
+        `playing_locally` is True only while a video the handoff left on the
+        Zidoo keeps playing; a video that is being handed off polls fast.
+        """
+        if connectivity_state in ("offline", "error"):
+            if self.state != self.STATE_OFFLINE:
+                self.offline_streak = 0
+            self.state = self.STATE_OFFLINE
+            self.offline_streak += 1
+        elif playing_locally:
+            self.state = self.STATE_PLAYING
+            self.offline_streak = 0
+        else:
+            self.state = self.STATE_IDLE
+            self.offline_streak = 0
+
+    def next_interval(self, general: Optional[GeneralConfig] = None) -> float:
+        """Interval to wait before the next poll, in seconds (from the poll's config snapshot if given)"""
+        general = general or settings.general
+        idle_ms = clamp_heart_rate("heart_rate", general.heart_rate)
+
+        if self.state == self.STATE_PLAYING:
+            interval_ms = clamp_heart_rate("playing_heart_rate", general.playing_heart_rate)
+        elif self.state == self.STATE_OFFLINE:
+            max_ms = clamp_heart_rate("offline_heart_rate_max", general.offline_heart_rate_max)
+            backoff_ms = idle_ms * (2 ** min(self.offline_streak, 16))
+            jitter = random.uniform(1 - self.JITTER, 1 + self.JITTER)
+            interval_ms = min(backoff_ms, max_ms) * jitter
+        else:
+            interval_ms = idle_ms
+
+        self.current_interval_ms = int(interval_ms)
+        return interval_ms / 1000.0
+
+    def get_status(self) -> dict:
+        """Get scheduler status"""
+        return {
+            "state": self.state,
+            "interval_ms": self.current_interval_ms,
+            "offline_streak": self.offline_streak
+        }
+
+class LoopTimingStats:
+    """Achieved heartbeat period and its jitter against the scheduled interval"""
+
+    def __init__(self, window: int = 512):
+        self.periods = RollingWindow(window)
+        self.jitters = RollingWindow(window)
+        self.work_times = RollingWindow(window)
+        self.overruns = 0
+        self._last_start: Optional[float] = None
+        self._last_interval: Optional[float] = None
+
+    def reset(self):
+        self.periods.clear()
+        self.jitters.clear()
+        self.work_times.clear()
+        self.overruns = 0
+        self._last_start = None
+        self._last_interval = None
+
+    def record(self, start: float, work_time: float, interval: float):
+        """Record one poll that started at `start` (monotonic seconds)"""
+        if self._last_start is not None and self._last_interval is not None:
+            period = start - self._last_start
+            self.periods.add(period)
+            self.jitters.add(abs(period - self._last_interval))
+        self.work_times.add(work_time)
+        if work_time > interval:
+            self.overruns += 1
+        self._last_start = start
+        self._last_interval = interval
+
+    def get_stats(self) -> dict:
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+
+        jitter = self.jitters.percentiles(50, 99)
+        return {
+            "samples": len(self.periods),
+            "mean_period_ms": ms(self.periods.mean()),
+            "mean_jitter_ms": ms(self.jitters.mean()),
+            "p50_jitter_ms": ms(jitter[50]),
+            "p99_jitter_ms": ms(jitter[99]),
+            "max_jitter_ms": ms(max(self.jitters.samples) if len(self.jitters) else None),
+            "mean_work_ms": ms(self.work_times.mean()),
+            "overruns": self.overruns
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from app.core.config import settings, get_config_dir
+from app.core.logger import logger
+from app.core.log_buffer import log_buffer
+from app.services.path_trie import normalize_path
+
+INDEX_FILE_NAME = "strm_index.json"
+INDEX_FORMAT_VERSION = 1
+
+class StrmIndexer:
+    """
+    Background index of .strm file contents under the enabled strm mapping targets
+
+    The index maps each .strm file path to its mtime, size and content so
+    extract_real_path only needs a stat, not a read, of the network share.
+    Directories are scanned concurrently; on refresh a directory whose mtime is
+    unchanged reuses its previous listing, so only changed directories are listed
+    again. Editing a file in place does not change its directory's mtime, so
+    callers must check the file's mtime and size before using an entry.
+
+    On-disk layout (compact JSON next to config.yaml):
+        {"version": 1, "dirs": {dir: [mtime_ns, [subdir names], {file name: [mtime_ns, size, content]}]}}
+    """
+
+    def __init__(self, is_supported_content: Callable[[str], bool], index_path: Optional[str] = None):
+        self.is_supported_content = is_supported_content
+        self.index_path = index_path or os.path.join(get_config_dir(), INDEX_FILE_NAME)
+        self._dirs: Dict[str, list] = {}
+        self._files: Dict[str, list] = {}  # normalized .strm path -> [mtime_ns, size, content]
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._refresh_lock = asyncio.Lock()
+        self._stop_event = asyncio.Event()
+        self.stats = {
+            "scans": 0,
+            "last_scan_at": None,
+            "last_scan_seconds": None,
+            "dirs_listed": 0,
+            "dirs_reused": 0,
+            "files_read": 0,
+            "lookups": 0,
+            "hits": 0
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Load the persisted index and start periodic refreshes"""
+        if self.is_running:
+            return
+        self._stop_event = asyncio.Event()
+        await asyncio.get_running_loop().run_in_executor(None, self._load)
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """Stop refreshing; scan threads stuck on a hung mount are abandoned"""
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Thread pool for the blocking directory scans, kept for the indexer's lifetime"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.strm.index_scan_workers),
+                thread_name_prefix="strm-index"
+            )
+        return self._executor
+
+    def lookup(self, actual_strm_path: str) -> Optional[Tuple[int, int, str]]:
+        """
+        Return the indexed (st_mtime_ns, st_size, content) of a .strm file, or None on a miss
+
+        The entry reflects the last scan; compare mtime and size with the file
+        before trusting the content.
+        """
+        self.stats["lookups"] += 1
+        entry = self._files.get(normalize_path(actual_strm_path))
+        if entry is None:
+            return None
+        self.stats["hits"] += 1
+        return entry[0], entry[1], entry[2]
+
+    async def _refresh_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"STRM索引扫描失败: {e}")
+            interval = max(1, settings.strm.index_refresh_minutes) * 60
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _get_roots() -> List[str]:
+        roots = []
+        for mapping in settings.mapping_paths:
+            if mapping.mapping_type == "strm" and mapping.enable and mapping.target:
+                root = normalize_path(mapping.target).rstrip('/') or '/'
+                if root not in roots:
+                    roots.append(root)
+        return roots
+
+    async def refresh(self) -> dict:
+        """Incrementally rescan every strm mapping target"""
+        async with self._refresh_lock:
+            started = time.monotonic()
+            roots = self._get_roots()
+            old_dirs = self._dirs
+            new_dirs: Dict[str, list] = {}
+            counters = {"listed": 0, "reused": 0, "read": 0}
+            loop = asyncio.get_running_loop()
+
+            executor = self._get_executor()
+            frontier = [root for root in roots]
+            while frontier:
+                results = await asyncio.gather(*(
+                    loop.run_in_executor(executor, self._scan_dir, path, old_dirs.get(path))
+                    for path in frontier
+                ), return_exceptions=True)
+                next_frontier = []
+                for path, result in zip(frontier, results):
+                    if isinstance(result, Exception):
+                        if not isinstance(result, FileNotFoundError):
+                            logger.warning(f"扫描STRM目录失败: {path}: {result}")
+                        continue
+                    entry, listed, files_read = result
+                    new_dirs[path] = entry
+                    counters["listed" if listed else "reused"] += 1
+                    counters["read"] += files_read
+                    next_frontier.extend(f"{path.rstrip('/')}/{name}" for name in entry[1])
+                frontier = next_frontier
+
+            self._dirs = new_dirs
+            self._files = self._flatten(new_dirs)
+            await loop.run_in_executor(None, self._save)
+
+            elapsed = time.monotonic() - started
+            self.stats.update({
+                "scans": self.stats["scans"] + 1,
+                "last_scan_at": time.time(),
+                "last_scan_seconds": round(elapsed, 3),
+                "dirs_listed": counters["listed"],
+                "dirs_reused": counters["reused"],
+                "files_read": counters["read"]
+            })
+            logger.info(f"STRM索引已更新: {len(self._files)} 个文件, 重新列出 {counters['listed']} 个目录, "
+                        f"复用 {counters['reused']} 个目录, 耗时 {elapsed:.2f}秒")
+            if counters["listed"]:
+                log_buffer.add_log(f"STRM索引已更新，共 {len(self._files)} 个文件", "INFO")
+            return self.get_stats()
+
+    def _scan_dir(self, path: str, old_entry: Optional[list]) -> Tuple[list, bool, int]:
+        """
+        Blocking scan of one directory (runs in the scan thread pool)
+
+        Returns:
+            (entry, listed, files_read): entry is [mtime_ns, subdirs, files]
+        """
+        mtime_ns = os.stat(path).st_mtime_ns
+        if old_entry is not None and old_entry[0] == mtime_ns:
+            return old_entry, False, 0
+
+        old_files = old_entry[2] if old_entry is not None else {}
+        subdirs = []
+        files = {}
+        files_read = 0
+        with os.scandir(path) as it:
+            for dir_entry in it:
+                try:
+                    if dir_entry.is_dir(follow_symlinks=False):
+                        subdirs.append(dir_entry.name)
+                        continue
+                    if not dir_entry.name.lower().endswith('.strm'):
+                        continue
+                    st = dir_entry.stat()
+                    previous = old_files.get(dir_entry.name)
+                    if previous is not None and previous[0] == st.st_mtime_ns and previous[1] == st.st_size:
+                        files[dir_entry.name] = previous
+                        continue
+                    with open(dir_entry.path, 'r', encoding='utf-8') as f:
+                        content = f.read().strip()
+                    files_read += 1
+                    if self.is_supported_content(content):
+                        files[dir_entry.name] = [st.st_mtime_ns, st.st_size, content]
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.debug(f"跳过无法读取的STRM文件 {dir_entry.path}: {e}")
+        return [mtime_ns, sorted(subdirs), files], True, files_read
+
+    @staticmethod
+    def _flatten(dirs: Dict[str, list]) -> Dict[str, list]:
+        files = {}
+        for path, entry in dirs.items():
+            prefix = path.rstrip('/')
+            for name, file_entry in entry[2].items():
+                files[f"{prefix}/{name}"] = file_entry
+        return files
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_FORMAT_VERSION:
+                logger.info("STRM索引格式已变化，将重新扫描")
+                return
+            self._dirs = data.get("dirs", {})
+            self._files = self._flatten(self._dirs)
+            logger.info(f"已加载STRM索引: {len(self._files)} 个文件")
+        except Exception as e:
+            logger.warning(f"加载STRM索引失败，将重新扫描: {e}")
+            self._dirs = {}
+            self._files = {}
+
+    def _save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": INDEX_FORMAT_VERSION, "dirs": self._dirs}, f,
+                          ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            logger.error(f"保存STRM索引失败: {e}")
+
+    def get_stats(self) -> dict:
+        """Get indexer statistics"""
+        return {
+            **self.stats,
+            "enabled": settings.strm.index_enabled,
+            "running": self.is_running,
+            "files": len(self._files),
+            "dirs": len(self._dirs),
+            "index_path": self.index_path
+        }
@@ -1,10 +1,22 @@
+import asyncio
 import os
-from typing import Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional, Tuple
 from urllib.parse import urlparse, parse_qs, unquote
 from app.core.config import settings
 from app.core.logger import logger
 from app.core.log_buffer import log_buffer
+from app.core.lru_cache import LRUCache, MISSING
 from app.services.path_mapper import PathMapper
+from app.services.strm_indexer import StrmIndexer
+
+class _StrmCacheEntry(NamedTuple):
+    mtime_ns: int
+    size: int
+    content: str
+    mount_path: Optional[str]  # clouddrive.mount_path used to resolve Case 2 content; None if taken from the index
+    resolved: Optional[str]
 
 class StrmProcessor:
     """Service to extract real media file paths from .strm files"""
@@ -12,6 +24,167 @@ class StrmProcessor:
     def __init__(self, path_mapper: Optional[PathMapper] = None):
         """Initialize StrmProcessor with optional PathMapper for path translation"""
         self.path_mapper = path_mapper or PathMapper()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
+        # 已解析的STRM结果，按 (映射后路径, st_mtime_ns, st_size) 校验，文件被修改后自动失效
+        self._content_cache = LRUCache(maxsize=settings.strm.cache_size)
+        # 读取失败/文件不存在的负缓存：路径 -> 过期时间 (monotonic)
+        self._negative_cache = LRUCache(maxsize=settings.strm.cache_size)
+        self.cache_stats = {
+            "hits": 0,
+            "misses": 0,
+            "reresolved": 0,
+            "negative_hits": 0,
+            "index_hits": 0
+        }
+        
+        # 可选的后台索引，命中且文件 mtime/size 未变时播放时只需 stat，无需读取网络共享
+        self.indexer = StrmIndexer(self.is_supported_content)
+    
+    def _map_strm_path(self, zidoo_strm_path: str) -> str:
+        """Map Zidoo-specific path to actual file system path, falling back to the original path"""
+        actual_strm_path = self.path_mapper.map_to_strm_path(zidoo_strm_path)
+        if not actual_strm_path:
+            # If no mapping found, try using the original path directly
+            logger.debug(f"未找到STRM路径映射，使用原始路径: {zidoo_strm_path}")
+            return zidoo_strm_path
+        logger.debug(f"STRM路径已映射: {zidoo_strm_path} -> {actual_strm_path}")
+        return actual_strm_path
+    
+    @staticmethod
+    def _read_strm_file(actual_strm_path: str, validator: Optional[Tuple[int, int]] = None) -> Optional[Tuple[int, int, Optional[str]]]:
+        """
+        Blocking stat + read of a .strm file
+        
+        Args:
+            actual_strm_path: File system path of the .strm file
+            validator: (st_mtime_ns, st_size) of the cached copy, if any
+            
+        Returns:
+            None if the file does not exist, otherwise (st_mtime_ns, st_size, content);
+            content is None when the file still matches `validator` and was not read
+        """
+        try:
+            st = os.stat(actual_strm_path)
+        except FileNotFoundError:
+            return None
+        if validator is not None and validator == (st.st_mtime_ns, st.st_size):
+            return st.st_mtime_ns, st.st_size, None
+        with open(actual_strm_path, 'r', encoding='utf-8') as f:
+            return st.st_mtime_ns, st.st_size, f.read().strip()
+    
+    def _cache_precheck(self, actual_strm_path: str) -> Tuple[bool, Optional[_StrmCacheEntry]]:
+        """
+        Returns:
+            (negative_hit, entry): negative_hit is True if the path recently
+            failed to resolve; entry is the cached resolution, or else the
+            background index's copy, if any. Either is only used after the
+            file's mtime and size were checked against it.
+        """
+        expires_at = self._negative_cache.get(actual_strm_path)
+        if expires_at is not MISSING:
+            if time.monotonic() < expires_at:
+                self.cache_stats["negative_hits"] += 1
+                return True, None
+            self._negative_cache.pop(actual_strm_path)
+        
+        entry = self._content_cache.get(actual_strm_path, None)
+        if entry is None and settings.strm.index_enabled:
+            indexed = self.indexer.lookup(actual_strm_path)
+            if indexed is not None:
+                entry = _StrmCacheEntry(*indexed, mount_path=None, resolved=None)
+        return False, entry
+    
+    @staticmethod
+    def _validator(entry: Optional[_StrmCacheEntry]) -> Optional[Tuple[int, int]]:
+        return (entry.mtime_ns, entry.size) if entry is not None else None
+    
+    def _remember_failure(self, actual_strm_path: str):
+        """Cache a negative result for strm.negative_ttl_seconds"""
+        ttl = settings.strm.negative_ttl_seconds
+        if ttl > 0:
+            self._negative_cache.put(actual_strm_path, time.monotonic() + ttl)
+    
+    def _finish_read(self, read_result, cached: Optional[_StrmCacheEntry],
+                     actual_strm_path: str, zidoo_strm_path: str) -> Optional[str]:
+        """Resolve a _read_strm_file result through the content cache"""
+        if read_result is None:
+            logger.warning(f"STRM file not found: {actual_strm_path} (原始路径: {zidoo_strm_path})")
+            self._remember_failure(actual_strm_path)
+            return None
+        
+        mtime_ns, size, content = read_result
+        mount_path = settings.clouddrive.mount_path
+        
+        if content is None:
+            # File unchanged since it was cached
+            if cached.mount_path == mount_path:
+                self.cache_stats["hits"] += 1
+                log_buffer.add_log(f"检测到STRM文件内容(缓存): {cached.content}", "INFO")
+                return cached.resolved
+            # 索引命中或 mount_path 变化：复用已有内容重新解析，无需再次读取文件
+            content = cached.content
+            if cached.mount_path is None:
+                self.cache_stats["index_hits"] += 1
+                logger.debug(f"STRM索引命中: {actual_strm_path}")
+            else:
+                self.cache_stats["reresolved"] += 1
+        else:
+            self.cache_stats["misses"] += 1
+        
+        resolved = self._resolve_content(content, actual_strm_path, zidoo_strm_path)
+        self._content_cache.put(actual_strm_path, _StrmCacheEntry(mtime_ns, size, content, mount_path, resolved))
+        return resolved
+    
+    def clear_cache(self):
+        """Drop all cached STRM resolutions"""
+        self._content_cache.clear()
+        self._negative_cache.clear()
+    
+    def get_cache_stats(self) -> dict:
+        """Get STRM cache statistics"""
+        lru_stats = self._content_cache.get_stats()
+        return {
+            **self.cache_stats,
+            "entries": lru_stats["size"],
+            "maxsize": lru_stats["maxsize"],
+            "evictions": lru_stats["evictions"],
+            "negative_entries": len(self._negative_cache)
+        }
+    
+    @staticmethod
+    def is_supported_content(content: str) -> bool:
+        """Whether .strm content matches Case 1 (/mnt/) or Case 2 (http://...file_path=)"""
+        if not content:
+            return False
+        if content.startswith('/mnt/'):
+            return True
+        if content.startswith('http://'):
+            return 'file_path' in parse_qs(urlparse(content).query)
+        return False
+    
+    def _resolve_content(self, content: str, actual_strm_path: str, zidoo_strm_path: str) -> Optional[str]:
+        """Turn .strm file content into the real media path (Case 1 / Case 2)"""
+        # Log STRM file content to UI
+        log_buffer.add_log(f"检测到STRM文件内容: {content}", "INFO")
+        
+        if not content:
+            logger.warning(f"STRM file is empty: {actual_strm_path}")
+            return None
+        
+        # Case 1: Content starts with /mnt/
+        if content.startswith('/mnt/'):
+            logger.debug(f"STRM file contains /mnt/ path: {content}")
+            return content
+        
+        # Case 2: Content starts with http://
+        if content.startswith('http://'):
+            logger.debug(f"STRM file contains HTTP URL: {content}")
+            return self._extract_path_from_url(content)
+        
+        # Content doesn't match either case
+        logger.warning(f"STRM file content doesn't match Case 1 (/mnt/) or Case 2 (http://): {content[:100]}")
+        return None
     
     def extract_real_path(self, zidoo_strm_path: str) -> Optional[str]:
         """
@@ -24,6 +197,9 @@ class StrmProcessor:
         Case 2: Content starts with http:// -> parse URL, extract file_path parameter,
                 URL decode it, and merge with clouddrive.mount_path
         
+        This reads the file synchronously; inside the event loop use
+        extract_real_path_async instead.
+        
         Args:
             zidoo_strm_path: Zidoo-specific path to the .strm file (from Zidoo API)
             
@@ -34,51 +210,86 @@ class StrmProcessor:
             logger.warning("STRM path is empty")
             return None
         
-        # First, map Zidoo path to actual file system path
-        actual_strm_path = self.path_mapper.map_to_strm_path(zidoo_strm_path)
-        if not actual_strm_path:
-            # If no mapping found, try using the original path directly
-            actual_strm_path = zidoo_strm_path
-            logger.debug(f"未找到STRM路径映射，使用原始路径: {zidoo_strm_path}")
-        else:
-            logger.debug(f"STRM路径已映射: {zidoo_strm_path} -> {actual_strm_path}")
+        actual_strm_path = self._map_strm_path(zidoo_strm_path)
+        negative_hit, cached = self._cache_precheck(actual_strm_path)
+        if negative_hit:
+            logger.debug(f"STRM负缓存命中，跳过读取: {actual_strm_path}")
+            return None
         
         try:
-            # Read strm file content from actual file system path
-            if not os.path.exists(actual_strm_path):
-                logger.warning(f"STRM file not found: {actual_strm_path} (原始路径: {zidoo_strm_path})")
-                return None
-            
-            with open(actual_strm_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-            
-            # Log STRM file content to UI
-            log_buffer.add_log(f"检测到STRM文件内容: {content}", "INFO")
-            
-            if not content:
-                logger.warning(f"STRM file is empty: {actual_strm_path}")
-                return None
-            
-            # Case 1: Content starts with /mnt/
-            if content.startswith('/mnt/'):
-                logger.debug(f"STRM file contains /mnt/ path: {content}")
-                return content
-            
-            # Case 2: Content starts with http://
-            if content.startswith('http://'):
-                logger.debug(f"STRM file contains HTTP URL: {content}")
-                return self._extract_path_from_url(content)
-            
-            # Content doesn't match either case
-            logger.warning(f"STRM file content doesn't match Case 1 (/mnt/) or Case 2 (http://): {content[:100]}")
+            read_result = self._read_strm_file(actual_strm_path, self._validator(cached))
+        except UnicodeDecodeError as e:
+            logger.error(f"Failed to decode STRM file {actual_strm_path}: {e}")
+            self._remember_failure(actual_strm_path)
             return None
+        except Exception as e:
+            logger.error(f"Error reading STRM file {actual_strm_path}: {e}")
+            self._remember_failure(actual_strm_path)
+            return None
+        
+        return self._finish_read(read_result, cached, actual_strm_path, zidoo_strm_path)
+    
+    async def extract_real_path_async(self, zidoo_strm_path: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Non-blocking variant of extract_real_path
+        
+        The stat and read run in a bounded thread pool with a deadline, so a hung
+        network share yields a logged timeout instead of freezing the event loop.
+        
+        Args:
+            zidoo_strm_path: Zidoo-specific path to the .strm file (from Zidoo API)
+            timeout: Deadline in seconds (defaults to strm.read_timeout_seconds)
             
+        Returns:
+            Real media file path if extraction succeeds, None otherwise
+        """
+        if not zidoo_strm_path:
+            logger.warning("STRM path is empty")
+            return None
+        
+        if timeout is None:
+            timeout = settings.strm.read_timeout_seconds
+        
+        actual_strm_path = self._map_strm_path(zidoo_strm_path)
+        negative_hit, cached = self._cache_precheck(actual_strm_path)
+        if negative_hit:
+            logger.debug(f"STRM负缓存命中，跳过读取: {actual_strm_path}")
+            return None
+        
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), self._read_strm_file,
+                                      actual_strm_path, self._validator(cached))
+        try:
+            read_result = await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"读取STRM文件超时 ({timeout}秒): {actual_strm_path}")
+            log_buffer.add_log(f"读取STRM文件超时 ({timeout}秒)，网络共享可能无响应: {actual_strm_path}", "WARNING")
+            return None
         except UnicodeDecodeError as e:
             logger.error(f"Failed to decode STRM file {actual_strm_path}: {e}")
+            self._remember_failure(actual_strm_path)
             return None
         except Exception as e:
             logger.error(f"Error reading STRM file {actual_strm_path}: {e}")
+            self._remember_failure(actual_strm_path)
             return None
+        
+        return self._finish_read(read_result, cached, actual_strm_path, zidoo_strm_path)
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Bounded thread pool for blocking STRM file I/O"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.strm.io_workers),
+                thread_name_prefix="strm-io"
+            )
+        return self._executor
+    
+    def close(self):
+        """Release the I/O thread pool (threads stuck on a hung mount are abandoned)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
     
     def _extract_path_from_url(self, url: str) -> Optional[str]:
         """
@@ -0,0 +1,200 @@
+import asyncio
+from typing import Dict, List, Optional
+from app.core.config import settings, config_store, Settings
+from app.core.config_writer import config_writer
+from app.core.logger import logger
+from app.core.log_buffer import log_buffer
+from app.services.discovery import ZidooDiscovery
+from app.services.watcher_service import WatcherService, WatcherResources
+
+class WatcherManager:
+    """
+    One WatcherService per configured Zidoo device
+
+    All watchers run on the same event loop and share one WatcherResources
+    (Zidoo HTTP pool, notification service, STRM processor), so each extra
+    device only costs its heartbeat task and a few small state objects.
+    Without a `devices` list in the config there is a single "default"
+    device backed by the `zidoo` section, as before.
+
+    With discovery.follow_ip_changes a separate task learns each device's
+    MAC address and, when a device goes offline, rescans the LAN to follow
+    it to its new IP.
+    """
+
+    def __init__(self):
+        self.resources = WatcherResources()
+        self.watchers: Dict[str, WatcherService] = {}
+        self.discovery = ZidooDiscovery()
+        self._follow_task: Optional[asyncio.Task] = None
+        self.sync_devices()
+
+    def sync_devices(self) -> List[str]:
+        """Create watchers for newly configured devices and drop stopped ones that were removed
+
+        Returns:
+            List[str]: names of the configured devices
+        """
+        names = settings.get_device_names()
+        for name in names:
+            if name not in self.watchers:
+                self.watchers[name] = WatcherService(name, resources=self.resources)
+        for name in [n for n in self.watchers if n not in names]:
+            if not self.watchers[name].is_running:
+                del self.watchers[name]
+        return names
+
+    @property
+    def is_running(self) -> bool:
+        return any(watcher.is_running for watcher in self.watchers.values())
+
+    def get(self, device: Optional[str] = None) -> Optional[WatcherService]:
+        """Watcher of a device, or of the first device when no name is given"""
+        if device is None:
+            return next(iter(self.watchers.values()), None)
+        return self.watchers.get(device)
+
+    async def start(self, device: Optional[str] = None):
+        """Start the watcher of one device, or of every configured device"""
+        if device is not None:
+            await self.watchers[device].start()
+            return
+        names = self.sync_devices()
+        await asyncio.gather(*(self.watchers[name].start() for name in names))
+        if self._follow_task is None or self._follow_task.done():
+            self._follow_task = asyncio.create_task(self._follow_loop())
+
+    async def stop(self, device: Optional[str] = None):
+        """Stop the watcher of one device, or all of them"""
+        if device is not None:
+            await self.watchers[device].stop()
+            return
+        if self._follow_task is not None:
+            self._follow_task.cancel()
+            try:
+                await self._follow_task
+            except asyncio.CancelledError:
+                pass
+            self._follow_task = None
+        running = [watcher for watcher in self.watchers.values() if watcher.is_running]
+        await asyncio.gather(*(watcher.stop() for watcher in running))
+        self.sync_devices()
+
+    async def apply_config(self, old: Settings, new: Settings):
+        """Listener for reloaded config: start added devices, stop removed ones, update shared services
+
+        Changed addresses of existing devices need nothing here, every poll
+        reads the current snapshot.
+        """
+        await self.resources.apply_config(old, new)
+        if new.devices is old.devices and new.zidoo is old.zidoo:
+            return
+        was_running = self.is_running
+        names = self.sync_devices()
+        removed = [watcher for name, watcher in self.watchers.items() if name not in names and watcher.is_running]
+        await asyncio.gather(*(watcher.stop() for watcher in removed))
+        if was_running:
+            added = [self.watchers[name] for name in names if not self.watchers[name].is_running]
+            await asyncio.gather(*(watcher.start() for watcher in added))
+        self.sync_devices()
+    
+    async def discover_on_startup(self):
+        """Startup option: scan the LAN and fix device addresses before the first poll"""
+        try:
+            await self.discovery.scan(force=True)
+        except ValueError as e:
+            logger.warning(f"启动时扫描Zidoo设备失败: {e}")
+            return
+        if self._apply_discovery(adopt_single=True):
+            config_writer.mark_dirty()
+
+    def _apply_discovery(self, adopt_single: bool = False) -> bool:
+        """Move devices to the IP the last scan found for their MAC
+
+        Args:
+            adopt_single: with one configured device that has no MAC and does not
+                answer at its IP, adopt the only Zidoo found on the LAN
+        """
+        changed = False
+        names = settings.get_device_names()
+        for name in names:
+            device = settings.get_device(name)
+            if device is None:
+                continue
+            if device.mac:
+                found = self.discovery.find_by_mac(device.mac)
+            elif adopt_single and len(names) == 1 and len(self.discovery.results) == 1 \
+                    and device.ip not in self.discovery.results:
+                found = next(iter(self.discovery.results.values()))
+            else:
+                found = None
+            if found is None or found["ip"] == device.ip:
+                continue
+            logger.info(f"Zidoo设备地址已变化: {name} {device.ip} -> {found['ip']}")
+            log_buffer.add_log(f"Zidoo设备 {name} 的IP地址已变化: {device.ip} -> {found['ip']}", "WARNING")
+            fields = {"ip": found["ip"]}
+            if found.get("mac"):
+                fields["mac"] = found["mac"]
+            config_store.update_device(name, **fields)
+            changed = True
+        return changed
+
+    async def follow_devices(self) -> bool:
+        """Learn MACs of online devices and relocate offline ones; returns True if the config changed"""
+        changed = False
+        offline = False
+        for name, watcher in list(self.watchers.items()):
+            device = settings.get_device(name)
+            if device is None or not watcher.is_running:
+                continue
+            state = watcher.device_connectivity_state
+            if state == "online" and not device.mac:
+                info = await ZidooDiscovery.fetch_model(device.ip)
+                if info and info.get("mac"):
+                    config_store.update_device(name, mac=info["mac"])
+                    changed = True
+                    logger.info(f"已记录Zidoo设备MAC地址: {name} {info['mac']}")
+            elif state == "offline" and device.mac:
+                offline = True
+
+        if offline:
+            await self.discovery.scan(force=True)
+            changed = self._apply_discovery() or changed
+        if changed:
+            config_writer.mark_dirty()
+        return changed
+
+    async def _follow_loop(self):
+        while True:
+            await asyncio.sleep(max(settings.discovery.follow_interval_seconds, 10))
+            if not settings.discovery.follow_ip_changes:
+                continue
+            try:
+                await self.follow_devices()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"跟随Zidoo设备地址时出错: {e}")
+
+    def get_devices_summary(self) -> Dict[str, dict]:
+        """Compact per-device state for the status overview"""
+        summary = {}
+        for name, watcher in self.watchers.items():
+            last_status = watcher.last_status or {}
+            summary[name] = {
+                "is_running": watcher.is_running,
+                "device_connectivity": watcher.device_connectivity_state,
+                "status": last_status.get("status"),
+                "last_notified_path": watcher.last_notified_path,
+                "poll_state": watcher.poll_scheduler.state
+            }
+        return summary
+
+    def get_status(self, device: Optional[str] = None) -> Optional[dict]:
+        """Full status of one device (the first device by default) plus the device overview"""
+        watcher = self.get(device)
+        if watcher is None:
+            return None
+        status = watcher.get_status()
+        status["devices"] = self.get_devices_summary()
+        return status
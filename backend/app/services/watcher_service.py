@@ -2,14 +2,21 @@ import asyncio
 import time
 import os
 import platform
-from typing import Optional
-from app.services.zidoo_client import ZidooClient
+from typing import Dict, Optional
+from app.services.zidoo_client import ZidooClient, ZidooConnectionPool
 from app.services.path_mapper import PathMapper
-from app.services.notification_service import NotificationService
+from app.services.notification_service import NotificationService, NotificationResult
 from app.services.strm_processor import StrmProcessor
-from app.core.config import settings
+from app.services.poll_scheduler import PollScheduler, LoopTimingStats
+from app.services.handoff_budget import HandoffBudget, HandoffDeadlineExceeded
+from app.services.event_bus import (
+    EventBus, WatcherEvent,
+    EVENT_PLAY_STARTED, EVENT_PLAY_STOPPED, EVENT_DEVICE_OFFLINE, EVENT_DEVICE_ONLINE
+)
+from app.core.config import settings, config_store, Settings, DEFAULT_DEVICE
 from app.core.logger import logger
 from app.core.log_buffer import log_buffer
+from app.core.stats import RollingWindow
 
 # 设置时区 - 针对不同操作系统
 if platform.system() == "Windows":
@@ -36,12 +43,71 @@ def get_utc_timestamp():
     """获取UTC时间戳"""
     return time.time()
 
-class WatcherService:
+class WatcherResources:
+    """
+    Services shared by the watchers of all devices: the Zidoo HTTP pool,
+    path mapper, notification service (keep-alive, health, outbox) and the
+    STRM processor with its indexer. Started by the first watcher that
+    starts and released when the last one stops.
+    """
+    
     def __init__(self):
-        self.zidoo_client = ZidooClient()
+        self.zidoo_pool = ZidooConnectionPool()
         self.path_mapper = PathMapper()
         self.notification_service = NotificationService()
         self.strm_processor = StrmProcessor(path_mapper=self.path_mapper)
+        self._users = 0
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        async with self._lock:
+            self._users += 1
+            if self._users > 1:
+                return
+            await self.zidoo_pool.start()
+            await self.notification_service.start()
+            if settings.strm.index_enabled:
+                await self.strm_processor.indexer.start()
+    
+    async def release(self):
+        async with self._lock:
+            self._users = max(self._users - 1, 0)
+            if self._users > 0:
+                return
+            # Release pooled connections to the Zidoo devices and the STRM I/O pool
+            await self.zidoo_pool.close()
+            await self.notification_service.close()
+            await self.strm_processor.indexer.stop()
+            self.strm_processor.close()
+    
+    async def apply_config(self, old: Settings, new: Settings):
+        """Bring running services in line with a reloaded config, touching only what changed"""
+        async with self._lock:
+            if self._users == 0:
+                return  # 未运行，下次启动时读取新配置
+            if new.notification is not old.notification or new.mapping_paths is not old.mapping_paths:
+                # 通知地址可能变化，关闭不再使用的连接池
+                await self.notification_service.prune_clients()
+            if new.notification.outbox_enabled != old.notification.outbox_enabled:
+                if new.notification.outbox_enabled:
+                    await self.notification_service.outbox.start()
+                else:
+                    await self.notification_service.outbox.stop()
+            if new.strm.index_enabled != old.strm.index_enabled:
+                if new.strm.index_enabled:
+                    await self.strm_processor.indexer.start()
+                else:
+                    await self.strm_processor.indexer.stop()
+
+class WatcherService:
+    def __init__(self, device_name: str = DEFAULT_DEVICE, resources: Optional[WatcherResources] = None):
+        self.device_name = device_name
+        self.log_prefix = "" if device_name == DEFAULT_DEVICE else f"[{device_name}] "
+        self.resources = resources if resources is not None else WatcherResources()
+        self.zidoo_client = ZidooClient(device_name, pool=self.resources.zidoo_pool)
+        self.path_mapper = self.resources.path_mapper
+        self.notification_service = self.resources.notification_service
+        self.strm_processor = self.resources.strm_processor
         
         self.is_running = False
         self.is_paused = False
@@ -50,38 +116,65 @@ class WatcherService:
         self.last_notified_path = None
         self.device_connectivity_state = "unknown"  # Track device connectivity
         self.last_handled_video = None  # Track last video that was actually handled/processed
+        self.left_playing_locally = None  # Video the last handoff left playing on the Zidoo (unmapped, 503, resumed...)
+        self._last_seen_status = None  # Last status object from ZidooClient, for the unchanged-response fast path
+        self.poll_scheduler = PollScheduler()
+        self.loop_timing = LoopTimingStats()
+        self.detect_to_notify = RollingWindow(256)  # 从检测到播放到通知返回的耗时 (秒)
+        self.handoff_stage_timings: Dict[str, RollingWindow] = {}  # 播放交接各阶段耗时 (秒)
+        self.handoff_deadline_exceeded: Dict[str, int] = {}  # 超出总时限的阶段 -> 次数
+        self.last_handoff: Optional[dict] = None
+        self._stop_event = asyncio.Event()
+        
+        # 心跳循环只负责发布事件，耗时的处理在事件总线的独立任务中执行
+        self.event_bus = EventBus(max_concurrency=settings.general.event_concurrency)
+        self.event_bus.subscribe(EVENT_PLAY_STARTED, self._on_play_started)
+        self.event_bus.subscribe(EVENT_PLAY_STOPPED, self._on_play_stopped)
+        self.event_bus.subscribe(EVENT_DEVICE_OFFLINE, self._on_device_offline)
+        self.event_bus.subscribe(EVENT_DEVICE_ONLINE, self._on_device_online)
         
     async def start(self):
         """Start the watcher service"""
         if self.is_running:
-            logger.warning("监控服务已在运行中")
+            logger.warning(f"{self.log_prefix}监控服务已在运行中")
             return
             
         self.is_running = True
         self.is_paused = False
+        self.poll_scheduler.reset()
+        self.loop_timing.reset()
+        self._stop_event = asyncio.Event()
+        
+        # Open the shared keep-alive pools before the first poll
+        await self.resources.acquire()
+        self.event_bus.max_concurrency = max(1, settings.general.event_concurrency)
+        await self.event_bus.start()
         self.task = asyncio.create_task(self._heartbeat_loop())
         
         # Immediately check device status when starting
         await self._check_play_status()
         
-        logger.info("监控服务已启动")
-        log_buffer.add_log("监控服务已启动", "INFO")
+        logger.info(f"{self.log_prefix}监控服务已启动")
+        self._ui_log("监控服务已启动", "INFO")
         
     async def stop(self):
         """Stop the watcher service"""
         if not self.is_running:
-            logger.warning("监控服务未在运行")
+            logger.warning(f"{self.log_prefix}监控服务未在运行")
             return
             
-        logger.info("正在停止监控服务...")
+        logger.info(f"{self.log_prefix}正在停止监控服务...")
         
-        # First set is_running to False to signal the loop to stop
+        # First set is_running to False and wake the loop so it stops
         self.is_running = False
+        self._stop_event.set()
         
         # Clear status immediately
         self.last_status = None
         self.last_notified_path = None
         self.last_handled_video = None
+        self.left_playing_locally = None
+        self._last_seen_status = None
         self.device_connectivity_state = "unknown"
         
         # Cancel the task if it exists
@@ -97,66 +190,103 @@ class WatcherService:
             finally:
                 self.task = None
         
-        logger.info("监控服务已成功停止")
-        log_buffer.add_log("监控服务已停止", "INFO")
+        # Cancel any in-flight event handlers
+        await self.event_bus.stop()
+        
+        # Release the shared pools once no device is watched any more
+        await self.zidoo_client.close()
+        await self.resources.release()
+        
+        logger.info(f"{self.log_prefix}监控服务已成功停止")
+        self._ui_log("监控服务已停止", "INFO")
         
     async def _heartbeat_loop(self):
-        """Main heartbeat monitoring loop"""
-        logger.info("心跳循环已启动")
-        while self.is_running:
+        """Main heartbeat monitoring loop
+        
+        Deadline-based on the monotonic clock: the poll duration is subtracted
+        from the interval so the period does not drift, and the idle wait only
+        wakes up on the next deadline or when stop() sets the stop event.
+        Each poll reads one config snapshot, so a concurrent update is seen
+        either entirely or not at all.
+        """
+        logger.info(f"{self.log_prefix}心跳循环已启动")
+        stop_event = self._stop_event
+        while self.is_running and not stop_event.is_set():
             try:
-                # Check if we should continue
-                if not self.is_running:
-                    logger.info("心跳循环停止 - is_running 为 False")
-                    break
-                    
-                await self._check_play_status()
+                poll_start = time.monotonic()
+                config = config_store.snapshot()
+                await self._check_play_status(config)
                 
-                # Wait for the configured heartbeat interval
-                # 修复：使用更精确的睡眠控制，避免整数除法精度问题
-                heart_rate_ms = settings.general.heart_rate
-                if heart_rate_ms < 200:
-                    # 如果设置的心跳频率小于200ms，使用设置值
-                    await asyncio.sleep(heart_rate_ms / 1000.0)
-                else:
-                    # 对于大于等于200ms的设置，使用分段睡眠以便及时响应停止信号
-                    remaining_ms = heart_rate_ms
-                    while remaining_ms > 0 and self.is_running:
-                        sleep_ms = min(100, remaining_ms)  # 最多睡眠100ms
-                        await asyncio.sleep(sleep_ms / 1000.0)
-                        remaining_ms -= sleep_ms
+                # Wait for the interval chosen by the scheduler for the current state
+                playing_locally = self.left_playing_locally is not None and self.left_playing_locally == self.last_notified_path
+                self.poll_scheduler.observe(self.device_connectivity_state, playing_locally)
+                interval = self.poll_scheduler.next_interval(config.general)
+                work_time = time.monotonic() - poll_start
+                self.loop_timing.record(poll_start, work_time, interval)
+                
+                # 如果本次轮询超时，立即开始下一次，不做追赶
+                remaining = (poll_start + interval) - time.monotonic()
+                if remaining > 0 and await self._wait_for_stop(remaining):
+                    logger.info("心跳循环停止 - 收到停止信号")
+                    break
                 
             except asyncio.CancelledError:
                 logger.info("心跳循环已取消")
                 break
             except Exception as e:
                 logger.error(f"心跳循环出错: {e}")
-                log_buffer.add_log(f"心跳循环出错: {e}", "ERROR")
-                await asyncio.sleep(1)  # Wait a bit before retrying
+                self._ui_log(f"心跳循环出错: {e}", "ERROR")
+                if await self._wait_for_stop(1):  # Wait a bit before retrying
+                    break
         
-        logger.info("心跳循环已结束")
+        logger.info(f"{self.log_prefix}心跳循环已结束")
+    
+    def _ui_log(self, message: str, level: str = "INFO"):
+        """Add a log line for the web UI, labelled with the device when several are watched"""
+        log_buffer.add_log(f"{self.log_prefix}{message}", level)
+    
+    async def _wait_for_stop(self, timeout: float) -> bool:
+        """Sleep up to `timeout` seconds; return True if stop was requested"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
     
     def get_status(self):
         """Get current service status"""
         return {
+            "device": self.device_name,
             "is_running": self.is_running,
             "is_paused": self.is_paused,
             "last_status": self.last_status,
             "last_notified_path": self.last_notified_path,
-            "device_connectivity": self.device_connectivity_state
+            "device_connectivity": self.device_connectivity_state,
+            "poll_scheduler": self.poll_scheduler.get_status(),
+            "loop_timing": self.loop_timing.get_stats(),
+            "handoff": self._get_handoff_stats(),
+            "notification": self.notification_service.get_stats(),
+            "downstream": self.notification_service.get_health_status(),
+            "event_bus": self.event_bus.get_stats()
         }
                 
-    async def _check_play_status(self):
+    async def _check_play_status(self, config: Optional[Settings] = None):
         """Check the current play status and handle state changes"""
-        status, connectivity_state = await self.zidoo_client.get_play_status()
+        status, connectivity_state = await self.zidoo_client.get_play_status(config)
         
         # Update connectivity state
         if connectivity_state != self.device_connectivity_state:
             self.device_connectivity_state = connectivity_state
             if connectivity_state == "offline":
-                log_buffer.add_log("Zidoo设备离线 - 继续监控", "WARNING")
+                self.event_bus.publish(WatcherEvent(EVENT_DEVICE_OFFLINE))
             elif connectivity_state == "online":
-                log_buffer.add_log("Zidoo设备已重新上线", "INFO")
+                self.event_bus.publish(WatcherEvent(EVENT_DEVICE_ONLINE))
+        
+        # Fast path: same response bytes as last poll, nothing can have changed
+        if status is not None and status is self._last_seen_status and self.last_status is not None:
+            self.last_status["timestamp"] = get_utc_timestamp()
+            return
+        self._last_seen_status = status
         
         if connectivity_state == "offline":
             # Device is offline - continue monitoring but show offline status
@@ -204,29 +334,78 @@ class WatcherService:
         }
         
         if is_playing and video_path:
-            current_status["title"] = status.video.title if status.video else "Unknown"
-            current_status["position"] = status.video.currentPosition if status.video else 0
-            current_status["duration"] = status.video.duration if status.video else 0
+            current_status["title"] = status.get_video_field("title", "Unknown")
+            current_status["position"] = status.get_video_field("currentPosition", 0)
+            current_status["duration"] = status.get_video_field("duration", 0)
             
-        # Handle state changes
+        # Handle state changes - publish events instead of awaiting the handlers,
+        # so a slow notification never freezes the polling cadence
         if is_playing and video_path:
             if self.last_notified_path != video_path:
                 # New video started playing
-                await self._handle_video_start(video_path, status)
                 self.last_notified_path = video_path
+                self.event_bus.publish(WatcherEvent(EVENT_PLAY_STARTED, video_path=video_path, status=status))
         else:
             # Video stopped playing - only log if we were actually handling the previous video
+            if self.last_notified_path is not None:
+                self.event_bus.publish(WatcherEvent(EVENT_PLAY_STOPPED, video_path=self.last_notified_path))
             self.last_notified_path = None
             self.last_handled_video = None
+            self.left_playing_locally = None
             
         self.last_status = current_status
+    
+    async def _on_play_started(self, event: WatcherEvent):
+        """Event handler for play_started"""
+        await self._handle_video_start(event.video_path, event.status, detected_at=event.detected_at)
+    
+    async def _on_play_stopped(self, event: WatcherEvent):
+        """Event handler for play_stopped"""
+        logger.debug(f"视频已停止播放: {event.video_path}")
+    
+    async def _on_device_offline(self, event: WatcherEvent):
+        """Event handler for device_offline"""
+        self._ui_log("Zidoo设备离线 - 继续监控", "WARNING")
+    
+    async def _on_device_online(self, event: WatcherEvent):
+        """Event handler for device_online"""
+        self._ui_log("Zidoo设备已重新上线", "INFO")
+        
+    async def _handle_video_start(self, video_path: str, status, detected_at: Optional[float] = None):
+        """Handle when a new video starts playing
         
-    async def _handle_video_start(self, video_path: str, status):
-        """Handle when a new video starts playing"""
+        The whole pipeline (STRM resolve, mapping, notify, stop) shares one
+        deadline, general.handoff_deadline_seconds, counted from detection.
+        Unless local playback was stopped, the video is recorded as left playing
+        locally so the heartbeat can slow down to general.playing_heart_rate.
+        
+        Args:
+            video_path: Path reported by the Zidoo
+            status: Play status the video was detected in
+            detected_at: time.monotonic() when the play was detected
+        """
+        config = config_store.snapshot()
+        budget = HandoffBudget(config.general.handoff_deadline_seconds, started_at=detected_at)
+        self.left_playing_locally = None
+        stopped = False
+        try:
+            stopped = await self._run_handoff(video_path, status, budget, config)
+        except HandoffDeadlineExceeded as e:
+            self.handoff_deadline_exceeded[e.stage] = self.handoff_deadline_exceeded.get(e.stage, 0) + 1
+            logger.error(f"播放交接超出总时限 ({e.deadline_seconds:g}秒)，已取消阶段: {e.stage}, 各阶段耗时: {budget.to_dict()['stages_ms']}")
+            self._ui_log(f"播放交接超出总时限 ({e.deadline_seconds:g}秒)，已取消阶段: {e.stage}", "ERROR")
+        finally:
+            budget.finish()
+            self._record_handoff(budget)
+            if not stopped and self.last_notified_path == video_path:
+                self.left_playing_locally = video_path
+    
+    async def _run_handoff(self, video_path: str, status, budget: HandoffBudget, config: Settings) -> bool:
+        """Resolve, map and hand off a new video; returns True if local playback was stopped"""
         # Log with both title and path for clarity
-        title = status.video.title if status.video else "未知"
+        title = status.get_video_field("title", "未知")
         logger.info(f"新视频开始播放: {title}")
-        log_buffer.add_log(f"检测到新视频开始播放: {video_path}", "INFO")
+        self._ui_log(f"检测到新视频开始播放: {video_path}", "INFO")
         
         # Check if this is a .strm file
         real_media_path = video_path
@@ -234,69 +413,182 @@ class WatcherService:
             logger.info(f"检测到STRM文件: {video_path}")
 
             # Extract real media path from strm file
-            real_media_path = self.strm_processor.extract_real_path(video_path)
+            real_media_path = await budget.run("strm", self.strm_processor.extract_real_path_async(video_path))
             
             if not real_media_path:
                 # Extraction failed or doesn't match Case 1 or Case 2
-                log_buffer.add_log("无法读取STRM文件，或STRM文件中未找到有效媒体路径，跳过通知并继续本地播放", "WARNING")
+                self._ui_log("无法读取STRM文件，或STRM文件中未找到有效媒体路径，跳过通知并继续本地播放", "WARNING")
                 logger.warning(f"无法从STRM文件提取有效路径: {video_path}")
-                return  # Skip notification, continue local playback
+                return False  # Skip notification, continue local playback
             else:
                 # Successfully extracted real path
-                log_buffer.add_log(f"成功从STRM文件提取真实媒体路径: {real_media_path}", "INFO")
+                self._ui_log(f"成功从STRM文件提取真实媒体路径: {real_media_path}", "INFO")
                 logger.info(f"成功从STRM文件提取路径: {video_path} -> {real_media_path}")
         
         # Check if the file extension is enabled for monitoring (use real_media_path, not video_path)
-        if not self._is_extension_enabled(real_media_path):
+        if not self._is_extension_enabled(real_media_path, config):
             logger.info(f"文件扩展名未启用监控: {real_media_path}")
-            log_buffer.add_log(f"文件扩展名未启用监控，跳过处理: {real_media_path}", "INFO")
-            return
+            self._ui_log(f"文件扩展名未启用监控，跳过处理: {real_media_path}", "INFO")
+            return False
         
         # Check path mapping with detailed status (use real_media_path, not video_path)
         # Note: We do NOT check if the .strm file location matches mapping_paths
-        mapped_path, mapping_status = self.path_mapper.check_path_mapping_status(real_media_path)
+        with budget.measure("mapping"):
+            mapped_path, mapping_status, endpoint = self.path_mapper.resolve_media_path(real_media_path)
         
         if mapped_path:
             # Successfully mapped - record that we're handling this video
             self.last_handled_video = video_path
             
             # Log mapping result
-            log_buffer.add_log(f"路径映射结果: {real_media_path} -> {mapped_path}", "INFO")
+            self._ui_log(f"路径映射结果: {real_media_path} -> {mapped_path}", "INFO")
+            
+            if config.notification.skip_when_down and self.notification_service.predict_offline(endpoint):
+                # 健康检查已知远程设备离线，不必等待通知返回503
+                logger.info(f"健康检查显示远程设备离线，跳过通知: {endpoint or config.notification.endpoint}")
+                self._ui_log("远程设备离线（健康检查），跳过通知，继续本机播放...", "INFO")
+                return False
+            
+            if config.notification.speculative_pause:
+                return await self._handoff_with_speculative_pause(mapped_path, endpoint, budget)
             
             # Log combined action
-            log_buffer.add_log("正在通知BlurayPoster并停止本机播放...", "INFO")
+            self._ui_log("正在通知BlurayPoster并停止本机播放...", "INFO")
             
             # Send notification synchronously and get status code
-            status_code = await self._send_notification_async(mapped_path)
+            result = await budget.run("notify", self._send_notification_async(mapped_path, endpoint))
+            self.detect_to_notify.add(time.monotonic() - budget.started_at)
             
-            # Only stop playback if status code is NOT 503
-            if status_code != 503:
-                await self._stop_playback_async()
+            # Stop playback only when the fan-out policy decided so
+            if result.stop_local:
+                stopped = await budget.run("stop", self._stop_playback_async())
+                if stopped:
+                    await self.notification_service.queue_undelivered(mapped_path, result)
+                return stopped
+            if result.status_code == 503:
+                self._ui_log(f"远程设备离线，继续本机播放...", "INFO")
             else:
-                log_buffer.add_log(f"远程设备离线，继续本机播放...", "INFO")
+                self._ui_log(f"通知未被接受 (状态码: {result.status_code})，继续本机播放...", "WARNING")
+            return False
             
         else:
             # No mapping found or mapping disabled - clear handled video
             self.last_handled_video = None
-            log_buffer.add_log(mapping_status, "WARNING")
+            self._ui_log(mapping_status, "WARNING")
+            return False
+    
+    async def _handoff_with_speculative_pause(self, mapped_path: str, endpoint: Optional[str], budget: HandoffBudget) -> bool:
+        """Pause locally while the notification is in flight, then stop or resume
+        
+        The viewer no longer sees the film keep playing for the whole notification
+        round-trip. The notification is sent in strict mode, so playback is stopped
+        only when the fan-out policy saw the remote accept (2xx); on 503, timeout
+        or any error the Zidoo resumes playing. Resuming is recovery, so it
+        is not bounded by the handoff deadline.
+        
+        Returns:
+            bool: True if local playback was stopped
+        """
+        self._ui_log("正在通知BlurayPoster并暂停本机播放...", "INFO")
+        
+        pause_task = asyncio.create_task(self.zidoo_client.pause_playback())
+        try:
+            result = await budget.run("notify", self._send_notification_async(mapped_path, endpoint, strict=True))
+            self.detect_to_notify.add(time.monotonic() - budget.started_at)
+            paused = await budget.run("pause", pause_task)
+        except HandoffDeadlineExceeded:
+            # 超出时限时不能让本机停留在暂停状态；暂停请求未完成时无法确定状态，同样尝试恢复
+            if not pause_task.done():
+                pause_task.cancel()
+            pause_failed = pause_task.done() and not pause_task.cancelled() and pause_task.result() is False
+            if not pause_failed:
+                await self._resume_after_pause()
+            raise
+        
+        if result.stop_local:
+            stopped = await budget.run("stop", self._stop_playback_async())
+            if stopped:
+                await self.notification_service.queue_undelivered(mapped_path, result)
+            return stopped
+        
+        if result.status_code == 503:
+            self._ui_log("远程设备离线，恢复本机播放...", "INFO")
+        else:
+            self._ui_log(f"通知未被接受 (状态码: {result.status_code})，恢复本机播放...", "WARNING")
+        if paused:
+            await self._resume_after_pause()
+        return False
+    
+    async def _resume_after_pause(self):
+        if not await self.zidoo_client.resume_playback():
+            self._ui_log("恢复本机播放失败", "WARNING")
+    
+    def _record_handoff(self, budget: HandoffBudget):
+        """Keep the stage breakdown of the last handoff and per-stage timing windows"""
+        self.last_handoff = budget.to_dict()
+        for stage, seconds in budget.stages.items():
+            window = self.handoff_stage_timings.get(stage)
+            if window is None:
+                window = self.handoff_stage_timings[stage] = RollingWindow(256)
+            window.add(seconds)
+    
+    def _get_handoff_stats(self) -> dict:
+        """Detect-to-notify latency and per-stage handoff timing statistics"""
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+        
+        latency = self.detect_to_notify.percentiles(50, 99)
+        last = self.detect_to_notify.samples[-1] if len(self.detect_to_notify) else None
+        stages = {}
+        for stage, window in self.handoff_stage_timings.items():
+            stage_latency = window.percentiles(50, 99)
+            stages[stage] = {
+                "count": window.total_count,
+                "p50_ms": ms(stage_latency[50]),
+                "p99_ms": ms(stage_latency[99])
+            }
+        return {
+            "count": self.detect_to_notify.total_count,
+            "last_detect_to_notify_ms": ms(last),
+            "p50_detect_to_notify_ms": ms(latency[50]),
+            "p99_detect_to_notify_ms": ms(latency[99]),
+            "deadline_seconds": settings.general.handoff_deadline_seconds,
+            "deadline_exceeded": dict(self.handoff_deadline_exceeded),
+            "last": self.last_handoff,
+            "stages": stages
+        }
     
-    async def _send_notification_async(self, mapped_path: str) -> int:
+    async def _send_notification_async(self, mapped_path: str, endpoint: Optional[str] = None,
+                                       strict: bool = False) -> NotificationResult:
         """Send notification asynchronously
         
+        Args:
+            mapped_path: Mapped media path
+            endpoint: Per-mapping notification endpoint, None for notification.endpoint
+            strict: Require a 2xx from the primary endpoint before stopping
+        
         Returns:
-            int: HTTP status code from the notification endpoint
+            NotificationResult: status code and the fan-out policy's stop decision
         """
         try:
-            status_code = await self.notification_service.send_notification(mapped_path)
-            log_buffer.add_log(f"通知已发送，状态码: {status_code}", "INFO")
-            return status_code
+            result = await self.notification_service.send_notification(mapped_path, endpoint, strict)
+            if endpoint:
+                self._ui_log(f"通知已发送至 {endpoint}，状态码: {result.status_code}", "INFO")
+            else:
+                self._ui_log(f"通知已发送，状态码: {result.status_code}", "INFO")
+            return result
         except Exception as e:
             logger.error(f"发送通知时出错: {e}")
-            log_buffer.add_log(f"发送通知时出错: {e}", "ERROR")
-            return 0  # Return 0 for unexpected errors
+            self._ui_log(f"发送通知时出错: {e}", "ERROR")
+            # Unexpected errors keep the previous behaviour: status 0 stops unless strict
+            return NotificationResult(0, not strict, {}, {})
     
-    async def _stop_playback_async(self):
-        """Stop playback asynchronously"""
+    async def _stop_playback_async(self) -> bool:
+        """Stop playback asynchronously
+        
+        Returns:
+            bool: True if local playback was stopped
+        """
         try:
             logger.info("正在异步停止播放...")
             
@@ -304,18 +596,20 @@ class WatcherService:
             if stop_success:
                 logger.info("播放已成功停止")
             else:
-                log_buffer.add_log("停止本机播放失败", "WARNING")
+                self._ui_log("停止本机播放失败", "WARNING")
+            return stop_success
         except Exception as e:
             logger.error(f"停止播放时出错: {e}")
-            log_buffer.add_log(f"停止本机播放时出错: {e}", "ERROR") 
+            self._ui_log(f"停止本机播放时出错: {e}", "ERROR")
+            return False
 
-    def _is_extension_enabled(self, video_path: str) -> bool:
+    def _is_extension_enabled(self, video_path: str, config: Optional[Settings] = None) -> bool:
         """Check if the file extension is enabled for monitoring"""
         if not video_path:
             return False
         
         # Get extension monitoring settings
-        ext_config = settings.extension_monitoring
+        ext_config = (config or settings).extension_monitoring
         
         # Check for specific file extensions first
         path_lower = video_path.lower()
@@ -1,29 +1,247 @@
 import httpx
 import asyncio
+import hashlib
 import time
-from typing import Optional, Tuple
-from app.models.zidoo_models import ZidooPlayStatus
-from app.core.config import settings
+from typing import Optional, Tuple, Union
+from app.models.zidoo_models import LazyPlayStatus
+from app.core.config import settings, Settings, DeviceConfig, ZidooConfig, DEFAULT_DEVICE
 from app.core.logger import logger
+from app.core.stats import RollingWindow
+
+class ZidooConnectionPool:
+    """
+    Keep-alive HTTP pool shared by the clients of every watched device
+
+    Requests use absolute URLs, so one httpx client serves all devices and
+    keeps idle connections per device; a device whose IP changes simply
+    starts using a new origin while the old connections expire.
+    """
+    
+    def __init__(self, max_connections: int = 64, max_keepalive_connections: int = 32):
+        self.timeout = httpx.Timeout(10.0)  # 默认值；ZidooClient 按设备传入自适应超时
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=30.0)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+        self.stats = {
+            "clients_created": 0,
+            "clients_closed": 0,
+            "requests_sent": 0,
+            "request_errors": 0
+        }
+    
+    async def start(self):
+        """Open the pool"""
+        await self._get_client()
+    
+    async def close(self):
+        """Close the pool and its connections"""
+        async with self._client_lock:
+            if self._client is None:
+                return
+            try:
+                await self._client.aclose()
+            except Exception as e:
+                logger.debug(f"关闭Zidoo连接池时出错: {e}")
+            finally:
+                self._client = None
+                self.stats["clients_closed"] += 1
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        if self._client is not None:
+            return self._client
+        async with self._client_lock:
+            if self._client is None:
+                self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+                self.stats["clients_created"] += 1
+                logger.debug("已创建Zidoo连接池")
+            return self._client
+    
+    async def get(self, url: str, timeout: Optional[httpx.Timeout] = None) -> httpx.Response:
+        """Send a GET request through the pool (with a per-request timeout if given)"""
+        client = await self._get_client()
+        self.stats["requests_sent"] += 1
+        try:
+            if timeout is not None:
+                return await client.get(url, timeout=timeout)
+            return await client.get(url)
+        except httpx.RequestError:
+            self.stats["request_errors"] += 1
+            raise
+    
+    def get_stats(self) -> dict:
+        """Get connection pool statistics"""
+        connections = []
+        if self._client is not None:
+            # httpx 未公开连接池接口，这里尽量读取 httpcore 的连接信息
+            pool = getattr(self._client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+        return {
+            **self.stats,
+            "active": self._client is not None,
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections
+        }
 
 class ZidooClient:
-    def __init__(self):
-        # 移除初始化时的配置读取，改为每次请求时从内存获取最新配置
-        self.timeout = httpx.Timeout(10.0)
+    def __init__(self, device_name: str = DEFAULT_DEVICE, pool: Optional[ZidooConnectionPool] = None):
+        # 移除初始化时的配置读取，改为每次请求时从内存获取最新配置（按设备名称查找）
+        self.device_name = device_name
+        self.log_prefix = "" if device_name == DEFAULT_DEVICE else f"[{device_name}] "
         self.is_device_online = True  # Track device connectivity
         self.consecutive_errors = 0   # Track consecutive connection errors
         self.last_request_time = 0    # Track last request time for rate limiting
         self.min_request_interval = 0.2  # 最小请求间隔200ms，防止DDOS
         
-    async def get_play_status(self) -> Tuple[Optional[ZidooPlayStatus], str]:
+        # 长连接池：多设备时共享，单独使用时自己持有
+        self._owns_pool = pool is None
+        self.pool = pool if pool is not None else ZidooConnectionPool(max_connections=4, max_keepalive_connections=2)
+        self.request_stats = {
+            "requests_sent": 0,
+            "request_errors": 0,
+            "connect_timeouts": 0,
+            "read_timeouts": 0
+        }
+        
+        # 往返时间窗口：超时由观测到的 p99 推导，离线设备很快超时，慢响应不会误判
+        self.rtt = RollingWindow(256)
+        self.consecutive_read_timeouts = 0
+        
+        # 响应指纹：与上一次响应字节相同时直接复用已解析的状态
+        self._last_fingerprint: Optional[bytes] = None
+        self._last_play_status: Optional[LazyPlayStatus] = None
+        self.parse_stats = {
+            "parsed": 0,
+            "skipped": 0
+        }
+    
+    def _get_device(self, config: Optional[Settings] = None) -> Union[ZidooConfig, DeviceConfig]:
+        device = (config or settings).get_device(self.device_name)
+        if device is None:
+            raise RuntimeError(f"设备配置不存在: {self.device_name}")
+        return device
+    
+    def _get_base_url(self, device: Optional[Union[ZidooConfig, DeviceConfig]] = None) -> str:
+        """Build the Zidoo base URL from the in-memory settings (or the given device of a snapshot)"""
+        device = device or self._get_device()
+        return f"http://{device.ip}:{device.port}"
+    
+    async def start(self):
+        """Open the keep-alive connection pool (when this client owns it)"""
+        if self._owns_pool:
+            await self.pool.start()
+    
+    async def close(self):
+        """Close the keep-alive connection pool (when this client owns it)"""
+        self._reset_fingerprint()
+        if self._owns_pool:
+            await self.pool.close()
+    
+    @staticmethod
+    def _timeout_bounds() -> Tuple[float, float]:
+        general = settings.general
+        low = general.zidoo_timeout_min_seconds
+        return low, max(general.zidoo_timeout_max_seconds, low)
+    
+    def _adaptive_timeout(self) -> float:
+        """p99 RTT x factor within bounds; the upper bound until enough samples exist"""
+        low, high = self._timeout_bounds()
+        if len(self.rtt) < settings.general.zidoo_timeout_min_samples:
+            return high
+        return min(max(self.rtt.percentile(99) * settings.general.zidoo_timeout_factor, low), high)
+    
+    def get_request_timeout(self, command: bool = False) -> httpx.Timeout:
+        """Connect/read timeouts for the next request
+        
+        The connect timeout is always the adaptive value, so an unreachable
+        device is detected quickly. The read timeout doubles after each
+        consecutive read timeout (a slow but reachable device) and commands
+        (remote keys) always get the upper bound.
+        """
+        adaptive = self._adaptive_timeout()
+        _, high = self._timeout_bounds()
+        if command:
+            read = high
+        else:
+            read = min(adaptive * (2 ** min(self.consecutive_read_timeouts, 8)), high)
+        return httpx.Timeout(read, connect=adaptive)
+    
+    async def _request(self, path: str, command: bool = False,
+                       device: Optional[Union[ZidooConfig, DeviceConfig]] = None) -> httpx.Response:
+        """Send a GET request to this device through the pooled client"""
+        url = self._get_base_url(device) + path
+        timeout = self.get_request_timeout(command)
+        self.request_stats["requests_sent"] += 1
+        started = time.monotonic()
+        try:
+            response = await self.pool.get(url, timeout=timeout)
+        except httpx.ConnectTimeout:
+            self.request_stats["request_errors"] += 1
+            self.request_stats["connect_timeouts"] += 1
+            raise
+        except httpx.TimeoutException:
+            self.request_stats["request_errors"] += 1
+            self.request_stats["read_timeouts"] += 1
+            self.consecutive_read_timeouts += 1
+            raise
+        except httpx.RequestError:
+            self.request_stats["request_errors"] += 1
+            raise
+        self.rtt.add(time.monotonic() - started)
+        self.consecutive_read_timeouts = 0
+        response.raise_for_status()
+        return response
+    
+    def get_rtt_stats(self) -> dict:
+        """RTT percentiles and the timeouts currently derived from them"""
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+        
+        rtt = self.rtt.percentiles(50, 90, 99)
+        timeout = self.get_request_timeout()
+        return {
+            "samples": len(self.rtt),
+            "p50_ms": ms(rtt[50]),
+            "p90_ms": ms(rtt[90]),
+            "p99_ms": ms(rtt[99]),
+            "max_ms": ms(max(self.rtt.samples) if len(self.rtt) else None),
+            "connect_timeout_s": round(timeout.connect, 3),
+            "read_timeout_s": round(timeout.read, 3),
+            "consecutive_read_timeouts": self.consecutive_read_timeouts
+        }
+    
+    def get_pool_stats(self) -> dict:
+        """Get this device's request counters and the (possibly shared) pool statistics"""
+        return {
+            **self.request_stats,
+            "shared": not self._owns_pool,
+            "pool": self.pool.get_stats()
+        }
+        
+    async def get_play_status(self, config: Optional[Settings] = None) -> Tuple[Optional[LazyPlayStatus], str]:
         """
         Get the current play status from Zidoo player
         Returns: (status_object, connection_state)
         connection_state: "online", "offline", "error"
+        
+        When the raw response body is identical to the previous one, the same
+        status object is returned again, so callers can skip work with an
+        identity check. Only connect failures mark the device offline; a read
+        timeout returns no status and leaves the connectivity state unchanged.
+        
+        Args:
+            config: snapshot taken for this poll; address and API path both come from it
         """
         # 每次请求时从内存获取最新配置
-        base_url = f"http://{settings.zidoo.ip}:{settings.zidoo.port}"
-        api_path = settings.zidoo.api_path
+        try:
+            device = self._get_device(config)
+            api_path = device.api_path
+        except RuntimeError as e:
+            logger.error(str(e))
+            return None, "error"
         
         # 频率限制：确保请求间隔不小于最小间隔
         current_time = time.time()
@@ -34,118 +252,165 @@ class ZidooClient:
             await asyncio.sleep(sleep_time)
         
         self.last_request_time = time.time()
-        url = f"{base_url}{api_path}"
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                
-                data = response.json()
-                logger.debug(f"Zidoo API response: {data}")
-                
-                # Reset error counter on successful connection
-                if not self.is_device_online:
-                    logger.info("Zidoo设备已重新上线")
-                    await self._on_device_online()
-                
-                self.is_device_online = True
-                self.consecutive_errors = 0
-                
-                return ZidooPlayStatus(**data), "online"
-                
+            response = await self._request(api_path, device=device)
+            
+            # Reset error counter on successful connection
+            if not self.is_device_online:
+                logger.info(f"{self.log_prefix}Zidoo设备已重新上线")
+                await self._on_device_online()
+            
+            self.is_device_online = True
+            self.consecutive_errors = 0
+            
+            body = response.content
+            fingerprint = hashlib.blake2b(body, digest_size=16).digest()
+            if fingerprint == self._last_fingerprint and self._last_play_status is not None:
+                self.parse_stats["skipped"] += 1
+                return self._last_play_status, "online"
+            
+            status = LazyPlayStatus.from_bytes(body)
+            logger.debug(f"Zidoo API response: {body[:500]!r}")
+            self._last_fingerprint = fingerprint
+            self._last_play_status = status
+            self.parse_stats["parsed"] += 1
+            
+            return status, "online"
+            
         except httpx.ConnectError as e:
             # Device is likely offline or unreachable
-            logger.warning(f"Zidoo设备似乎离线: {e}")
+            logger.warning(f"{self.log_prefix}Zidoo设备似乎离线: {e}")
             await self._on_device_offline()
             return None, "offline"
             
-        except httpx.TimeoutException as e:
-            # Request timed out
-            logger.warning(f"Zidoo API请求超时: {e}")
+        except httpx.ConnectTimeout as e:
+            # Connection could not be established in time
+            logger.warning(f"{self.log_prefix}Zidoo API连接超时: {e}")
             await self._on_device_offline()
             return None, "offline"
             
+        except httpx.TimeoutException as e:
+            # Connected but the response was too slow: the device is reachable, so keep
+            # the current connectivity (no offline event or backoff); the next read
+            # timeout is doubled by get_request_timeout()
+            self._reset_fingerprint()
+            logger.warning(f"{self.log_prefix}Zidoo API响应超时: {e}")
+            return None, "online" if self.is_device_online else "offline"
+            
         except httpx.RequestError as e:
             # Network-related errors
-            logger.error(f"调用Zidoo API时网络错误: {e}")
+            logger.error(f"{self.log_prefix}调用Zidoo API时网络错误: {e}")
             await self._on_device_offline()
             return None, "offline"
             
         except httpx.HTTPStatusError as e:
             # HTTP errors (like 404, 500, etc.)
-            logger.error(f"调用Zidoo API时HTTP错误: {e.response.status_code}")
+            self._reset_fingerprint()
+            logger.error(f"{self.log_prefix}调用Zidoo API时HTTP错误: {e.response.status_code}")
             # HTTP errors might indicate device is online but API endpoint is wrong
             return None, "error"
             
         except Exception as e:
             # Unexpected errors
-            logger.error(f"调用Zidoo API时意外错误: {e}")
+            self._reset_fingerprint()
+            logger.error(f"{self.log_prefix}调用Zidoo API时意外错误: {e}")
             return None, "error"
     
+    def _reset_fingerprint(self):
+        """Forget the last response so the next one is parsed again"""
+        self._last_fingerprint = None
+        self._last_play_status = None
+    
     async def _on_device_offline(self):
         """Handle when device goes offline"""
+        self._reset_fingerprint()
         if self.is_device_online:
-            logger.info("Zidoo设备已离线")
+            logger.info(f"{self.log_prefix}Zidoo设备已离线")
             self.is_device_online = False
             self.consecutive_errors += 1
     
     async def _on_device_online(self):
         """Handle when device comes back online"""
-        logger.info("Zidoo设备已重新上线")
+        logger.info(f"{self.log_prefix}Zidoo设备已重新上线")
         self.is_device_online = True
         self.consecutive_errors = 0
     
-    def is_playing(self, status: ZidooPlayStatus) -> bool:
+    def is_playing(self, status: LazyPlayStatus) -> bool:
         """Check if the player is currently playing"""
         return (status.status == 200 and 
-                status.video is not None and 
-                status.video.status == 1)
+                status.video_status == 1)
     
-    def get_video_path(self, status: ZidooPlayStatus) -> Optional[str]:
+    def get_video_path(self, status: LazyPlayStatus) -> Optional[str]:
         """Get the video path from the status response"""
-        if self.is_playing(status) and status.video and status.video.path:
-            return status.video.path
+        if self.is_playing(status) and status.video_path:
+            return status.video_path
         return None
     
+    async def _send_key(self, key: str) -> dict:
+        """Send a remote control key to the Zidoo and return the JSON response"""
+        logger.debug(f"发送 {key} 命令...")
+        response = await self._request(f"/ZidooControlCenter/RemoteControl/sendkey?key={key}", command=True)
+        data = response.json()
+        logger.debug(f"{key} 响应: {data}")
+        return data
+    
     async def stop_playback(self) -> bool:
         """Stop the current playback"""
-        # 从内存获取最新配置
-        base_url = f"http://{settings.zidoo.ip}:{settings.zidoo.port}"
-        
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # First send Key.Back
-                back_url = f"{base_url}/ZidooControlCenter/RemoteControl/sendkey?key=Key.Back"
-                logger.debug("发送 Key.Back 命令...")
-                response = await client.get(back_url)
-                response.raise_for_status()
-                back_data = response.json()
-                logger.debug(f"Key.Back 响应: {back_data}")
-                
-                # Wait 100ms
-                await asyncio.sleep(0.1)
-                
-                # Then send Key.MediaStop
-                stop_url = f"{base_url}/ZidooControlCenter/RemoteControl/sendkey?key=Key.MediaStop"
-                logger.debug("发送 Key.MediaStop 命令...")
-                response = await client.get(stop_url)
-                response.raise_for_status()
-                
-                data = response.json()
-                logger.debug(f"停止播放响应: {data}")
-                return True
-                
+            # First send Key.Back
+            await self._send_key("Key.Back")
+            
+            # Wait 100ms
+            await asyncio.sleep(0.1)
+            
+            # Then send Key.MediaStop
+            await self._send_key("Key.MediaStop")
+            return True
+            
+        except Exception as e:
+            logger.error(f"{self.log_prefix}停止播放失败: {e}")
+            return False
+    
+    async def pause_playback(self) -> bool:
+        """Pause the current playback"""
+        try:
+            await self._send_key("Key.MediaPause")
+            return True
         except Exception as e:
-            logger.error(f"停止播放失败: {e}")
+            logger.error(f"{self.log_prefix}暂停播放失败: {e}")
+            return False
+    
+    async def resume_playback(self) -> bool:
+        """Resume a paused playback"""
+        try:
+            await self._send_key("Key.MediaPlay")
+            return True
+        except Exception as e:
+            logger.error(f"{self.log_prefix}恢复播放失败: {e}")
             return False
     
     def get_connectivity_status(self) -> dict:
         """Get current connectivity status"""
         # 从内存获取最新配置
-        base_url = f"http://{settings.zidoo.ip}:{settings.zidoo.port}"
+        try:
+            base_url = self._get_base_url()
+        except RuntimeError:
+            base_url = None
         return {
+            "device": self.device_name,
             "is_online": self.is_device_online,
             "consecutive_errors": self.consecutive_errors,
-            "base_url": base_url
+            "base_url": base_url,
+            "pool": self.get_pool_stats(),
+            "parse": self.get_parse_stats(),
+            "rtt": self.get_rtt_stats()
+        }
+    
+    def get_parse_stats(self) -> dict:
+        """Get response parse statistics (parsed vs. skipped by fingerprint)"""
+        total = self.parse_stats["parsed"] + self.parse_stats["skipped"]
+        return {
+            **self.parse_stats,
+            "skip_ratio": round(self.parse_stats["skipped"] / total, 4) if total else 0.0
         } 
\ No newline at end of file
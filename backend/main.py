@@ -36,12 +36,14 @@ else:
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.core.config import settings
+from app.core.config_writer import config_writer
+from app.core.config_reloader import config_reloader
 from app.api.routes import api_router
 from app.core.logger import logger
-from app.services.watcher_service import WatcherService
+from app.services.watcher_manager import WatcherManager
 
 # Global instances
-watcher_service = None
+watcher_manager = None
 
 # 禁用uvicorn的访问日志，减少轮询请求的日志输出
 logging.getLogger("uvicorn.access").setLevel(logging.ERROR)
@@ -49,34 +51,47 @@ logging.getLogger("uvicorn.access").setLevel(logging.ERROR)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global watcher_service
+    global watcher_manager
     
     logger.info("正在启动Zidoo Watcher应用...")
     
-    # Initialize Watcher service
-    watcher_service = WatcherService()
+    # Initialize Watcher services (one per configured device)
+    watcher_manager = WatcherManager()
     
     # Initialize global instances for API routes
     import app.api.routes as api_routes
-    api_routes.watcher_service = watcher_service
+    api_routes.watcher_manager = watcher_manager
+    
+    # Find the Zidoo devices on the LAN before the first poll if configured
+    if settings.discovery.scan_on_startup:
+        logger.info("正在扫描局域网中的Zidoo设备...")
+        await watcher_manager.discover_on_startup()
     
     # Auto-start the watcher service if configured
     if settings.general.auto_start:
         logger.info("已配置为自动启动监控服务，正在启动...")
         try:
-            await watcher_service.start()
+            await watcher_manager.start()
             logger.info("监控服务已自动启动")
         except Exception as e:
             logger.error(f"自动启动监控服务失败: {e}")
     else:
         logger.info("监控服务已准备就绪，请使用前端界面启动/停止服务。")
     
+    # Reload config.yaml when it is edited on the host
+    config_reloader.add_listener(watcher_manager.apply_config)
+    if settings.general.config_watch:
+        await config_reloader.start()
+    
     yield
     
     # Shutdown
     logger.info("正在关闭Zidoo Watcher应用...")
-    if watcher_service:
-        await watcher_service.stop()
+    await config_reloader.stop()
+    if watcher_manager:
+        await watcher_manager.stop()
+    # 写出尚未落盘的配置修改
+    await config_writer.flush()
 
 fastapi_app = FastAPI(
     title="Zidoo Watcher",
@@ -59,6 +59,7 @@ export const useWatcherStore = defineStore('watcher', () => {
       status: null
     },
     lastLogId: 0,
+    logEpoch: null, // changes when the server's log buffer is cleared or restarted
     retryCount: 0,
     maxRetries: 5
   })
@@ -77,18 +78,28 @@ export const useWatcherStore = defineStore('watcher', () => {
     
     const pollLogs = async () => {
       try {
-        const response = await axios.get('/api/logs/recent', {
-          params: { since_id: polling.value.lastLogId }
-        })
+        const params = { since_id: polling.value.lastLogId }
+        if (polling.value.logEpoch) {
+          params.epoch = polling.value.logEpoch
+        }
+        const response = await axios.get('/api/logs/recent', { params })
         
-        if (response.data.success && response.data.logs.length > 0) {
-          // Add new logs
-          response.data.logs.forEach(log => {
-            addLog(log)
-          })
+        if (response.data.success) {
+          // Server logs were cleared or the service restarted: IDs start over
+          if (response.data.reset) {
+            logs.value = []
+          }
+          polling.value.logEpoch = response.data.epoch
           
-          // Update last log ID
-          polling.value.lastLogId = response.data.latest_id
+          if (response.data.logs.length > 0 || response.data.reset) {
+            // Add new logs
+            response.data.logs.forEach(log => {
+              addLog(log)
+            })
+            
+            // Update last log ID
+            polling.value.lastLogId = response.data.latest_id
+          }
         }
         
         // Reset retry count on success
@@ -421,9 +432,10 @@ export const useWatcherStore = defineStore('watcher', () => {
 
   const clearLogs = async () => {
     try {
-      await axios.post('/api/logs/clear')
+      const response = await axios.post('/api/logs/clear')
       logs.value = []
       polling.value.lastLogId = 0
+      polling.value.logEpoch = response.data.epoch || null
     } catch (err) {
       error.value = err.message
       console.error('Error clearing logs:', err)